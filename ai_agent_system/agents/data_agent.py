@@ -113,7 +113,8 @@ Respond with just the query JSON."""
                 results = await self.opensearch.search(
                     index=index,
                     query=query_dsl.get("query", query_dsl),
-                    size=query_dsl.get("size", 10),
+                    # Generated queries may ask for more than one page allows
+                    size=min(query_dsl.get("size", 10), self.opensearch.MAX_PAGE_SIZE),
                     sort=query_dsl.get("sort")
                 )
             except Exception as e:
@@ -10,7 +10,7 @@ from contextlib import asynccontextmanager
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, UploadFile, File, Form, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 import sys
 sys.path.append('..')
@@ -223,7 +223,7 @@ class SearchRequest(BaseModel):
     index: str = "documents"
     filters: Optional[Dict[str, Any]] = None
     sort_by: Optional[str] = None
-    limit: int = 10
+    limit: int = Field(10, le=OpenSearchService.MAX_PAGE_SIZE)
 
 
 class ShiftLogRequest(BaseModel):
@@ -412,7 +412,7 @@ async def search(request: SearchRequest):
 async def get_recent(
     index: str = "events",
     hours: int = 24,
-    limit: int = 100
+    limit: int = Query(100, le=OpenSearchService.MAX_PAGE_SIZE)
 ):
     """Get recent items from an index."""
     if not opensearch:
@@ -432,7 +432,7 @@ async def get_recent(
 async def get_alerts(
     severity: Optional[str] = None,
     acknowledged: Optional[bool] = None,
-    limit: int = 50
+    limit: int = Query(50, le=OpenSearchService.MAX_PAGE_SIZE)
 ):
     """Get alerts."""
     if not opensearch:
@@ -459,12 +459,12 @@ async def create_alert(request: AlertRequest):
 
 
 @app.get("/alerts/active")
-async def get_active_alerts():
-    """Get active (unacknowledged) alerts."""
+async def get_active_alerts(limit: Optional[int] = None):
+    """Get active (unacknowledged) alerts; all of them unless limit is set."""
     if not redis:
         raise HTTPException(status_code=503, detail="Redis not available")
     
-    return await redis.alert_get_active()
+    return await redis.alert_get_active(limit=limit)
 
 
 @app.post("/alerts/{alert_id}/acknowledge")
@@ -483,7 +483,7 @@ async def acknowledge_alert(alert_id: str, user: str = "system"):
 async def get_shift_logs(
     operator: Optional[str] = None,
     status: Optional[str] = None,
-    limit: int = 50
+    limit: int = Query(50, le=OpenSearchService.MAX_PAGE_SIZE)
 ):
     """Get shift logs."""
     if not opensearch:
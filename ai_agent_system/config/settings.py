@@ -1,7 +1,9 @@
 """Configuration settings for the multi-agent AI system."""
 
 import os
-from typing import Optional, List, Dict
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Optional, List, Dict, Mapping, Tuple
 from pydantic_settings import BaseSettings
 
 
@@ -27,6 +29,8 @@ class Settings(BaseSettings):
     # Redis
     REDIS_URL: str = "redis://localhost:6379"
     REDIS_CACHE_TTL: int = 3600
+    REDIS_MAX_CONNECTIONS: int = 64
+    REDIS_LEGACY_CACHE_KEYS: bool = False
     
     # OpenSearch
     OPENSEARCH_HOSTS: List[str] = ["http://localhost:9200"]
@@ -38,6 +42,7 @@ class Settings(BaseSettings):
     
     # Tika
     TIKA_SERVER: str = "http://localhost:9998"
+    TIKA_MAX_CONN: int = 64
     
     # Ollama (Local LLMs)
     OLLAMA_HOST: str = "http://localhost:11434"
@@ -72,3 +77,41 @@ class Settings(BaseSettings):
 
 
 settings = Settings()
+
+
+@dataclass(frozen=True, slots=True)
+class _Resolved:
+    """Immutable snapshot of the infrastructure settings read on hot paths.
+    
+    Pydantic is only involved while building this at import time; afterwards
+    attribute reads are plain slot lookups.
+    """
+    
+    kafka_bootstrap: str
+    kafka_topics: Mapping[str, str]
+    redis_url: str
+    redis_cache_ttl: int
+    redis_max_connections: int
+    redis_legacy_cache_keys: bool
+    opensearch_hosts: Tuple[str, ...]
+    opensearch_index_prefix: str
+    seaweedfs_master: str
+    seaweedfs_filer: str
+    tika_server: str
+    tika_max_conn: int
+
+
+RESOLVED = _Resolved(
+    kafka_bootstrap=settings.KAFKA_BOOTSTRAP_SERVERS,
+    kafka_topics=MappingProxyType(dict(settings.KAFKA_TOPICS)),
+    redis_url=settings.REDIS_URL,
+    redis_cache_ttl=settings.REDIS_CACHE_TTL,
+    redis_max_connections=settings.REDIS_MAX_CONNECTIONS,
+    redis_legacy_cache_keys=settings.REDIS_LEGACY_CACHE_KEYS,
+    opensearch_hosts=tuple(settings.OPENSEARCH_HOSTS),
+    opensearch_index_prefix=settings.OPENSEARCH_INDEX_PREFIX,
+    seaweedfs_master=settings.SEAWEEDFS_MASTER,
+    seaweedfs_filer=settings.SEAWEEDFS_FILER,
+    tika_server=settings.TIKA_SERVER,
+    tika_max_conn=settings.TIKA_MAX_CONN,
+)
@@ -15,6 +15,10 @@ from .tika_service import TikaService
 from .redis_service import RedisService
 
 
+# Files larger than this are hashed in a worker thread
+HASH_OFFLOAD_BYTES = 1024 * 1024
+
+
 class IngestionPipeline:
     """Complete data ingestion pipeline with metadata extraction and tagging."""
     
@@ -51,8 +55,12 @@ class IngestionPipeline:
         ingestion_id = str(uuid.uuid4())
         start_time = datetime.utcnow()
         
-        # Calculate file hash for deduplication
-        file_hash = hashlib.sha256(file_content).hexdigest()
+        # Calculate file hash for deduplication; large files hash off the loop.
+        # The SHA-256 digest is persisted, so it must not change.
+        if len(file_content) > HASH_OFFLOAD_BYTES:
+            file_hash = (await asyncio.to_thread(hashlib.sha256, file_content)).hexdigest()
+        else:
+            file_hash = hashlib.sha256(file_content).hexdigest()
         
         # Check for duplicates
         cached = await self.redis.cache_get(f"file_hash:{file_hash}")
@@ -6,17 +6,23 @@ from typing import Dict, Any, Optional, Callable, List
 from datetime import datetime
 import uuid
 
+import orjson
 from aiokafka import AIOKafkaProducer, AIOKafkaConsumer
 from aiokafka.errors import KafkaError
 
 import sys
 sys.path.append('..')
-from config import settings
+from config import RESOLVED
 
 
 class KafkaMessage:
     """Structured Kafka message with full metadata."""
     
+    __slots__ = (
+        "id", "topic", "payload", "message_type", "source",
+        "tags", "metadata", "timestamp", "version"
+    )
+    
     def __init__(
         self,
         topic: str,
@@ -37,16 +43,19 @@ class KafkaMessage:
         self.version = "1.0"
     
     def to_dict(self) -> Dict[str, Any]:
+        # Bind attributes to locals once; the dict literal then uses LOAD_FAST
+        i, t, mt, s = self.id, self.topic, self.message_type, self.source
+        ts, v, tg, md, p = self.timestamp, self.version, self.tags, self.metadata, self.payload
         return {
-            "id": self.id,
-            "topic": self.topic,
-            "type": self.message_type,
-            "source": self.source,
-            "timestamp": self.timestamp,
-            "version": self.version,
-            "tags": self.tags,
-            "metadata": self.metadata,
-            "payload": self.payload
+            "id": i,
+            "topic": t,
+            "type": mt,
+            "source": s,
+            "timestamp": ts,
+            "version": v,
+            "tags": tg,
+            "metadata": md,
+            "payload": p
         }
     
     def to_json(self) -> bytes:
@@ -54,29 +63,42 @@ class KafkaMessage:
     
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> 'KafkaMessage':
-        msg = cls(
-            topic=data.get("topic", ""),
-            payload=data.get("payload", {}),
-            message_type=data.get("type", "unknown"),
-            source=data.get("source", "unknown"),
-            tags=data.get("tags", []),
-            metadata=data.get("metadata", {})
-        )
-        msg.id = data.get("id", msg.id)
-        msg.timestamp = data.get("timestamp", msg.timestamp)
+        # Bypass __init__ so consumed records don't pay for a fresh uuid4()
+        # and timestamp that would immediately be overwritten.
+        msg = object.__new__(cls)
+        msg.topic = data.get("topic", "")
+        msg.payload = data.get("payload", {})
+        msg.message_type = data.get("type", "unknown")
+        msg.source = data.get("source", "unknown")
+        msg.tags = data.get("tags") or []
+        msg.metadata = data.get("metadata") or {}
+        msg.version = data.get("version", "1.0")
+        
+        msg_id = data.get("id")
+        msg.id = msg_id if msg_id is not None else str(uuid.uuid4())
+        timestamp = data.get("timestamp")
+        msg.timestamp = timestamp if timestamp is not None else datetime.utcnow().isoformat()
         return msg
 
 
 class KafkaService:
     """Kafka service for message production and consumption."""
     
+    # Log batching
+    LOG_QUEUE_SIZE = 10000
+    LOG_BATCH_SIZE = 500
+    LOG_FLUSH_INTERVAL = 0.1
+    
     def __init__(self):
-        self.bootstrap_servers = settings.KAFKA_BOOTSTRAP_SERVERS
-        self.topics = settings.KAFKA_TOPICS
+        self.bootstrap_servers = RESOLVED.kafka_bootstrap
+        self.topics = RESOLVED.kafka_topics
         self.producer: Optional[AIOKafkaProducer] = None
         self.consumers: Dict[str, AIOKafkaConsumer] = {}
         self.handlers: Dict[str, List[Callable]] = {}
         self._running = False
+        self._log_queue: asyncio.Queue = asyncio.Queue(maxsize=self.LOG_QUEUE_SIZE)
+        self._log_flusher: Optional[asyncio.Task] = None
+        self.logs_dropped = 0
     
     async def start(self):
         """Start the Kafka producer."""
@@ -87,13 +109,22 @@ class KafkaService:
         )
         await self.producer.start()
         self._running = True
+        self._log_flusher = asyncio.create_task(self._flush_logs_loop())
         print(f"Kafka producer started: {self.bootstrap_servers}")
     
     async def stop(self):
         """Stop all Kafka connections."""
         self._running = False
         
+        if self._log_flusher:
+            # Let the flusher finish its in-flight batch and exit at the sentinel
+            await self._log_queue.put(None)
+            await self._log_flusher
+            self._log_flusher = None
+        
         if self.producer:
+            # Flush anything queued behind the sentinel before shutting down
+            await self._flush_pending_logs()
             await self.producer.stop()
         
         for consumer in self.consumers.values():
@@ -137,6 +168,26 @@ class KafkaService:
             print(f"Kafka publish error: {e}")
             raise
     
+    async def publish_many(self, messages: List[KafkaMessage]) -> int:
+        """Publish a batch of prepared messages, waiting once for all acks."""
+        if not self.producer:
+            raise RuntimeError("Kafka producer not started")
+        if not messages:
+            return 0
+        
+        # send() only enqueues into the producer's batch accumulator; the
+        # returned futures resolve once the broker acknowledges the batch.
+        futures = [
+            await self.producer.send(msg.topic, value=msg.to_dict(), key=msg.id)
+            for msg in messages
+        ]
+        results = await asyncio.gather(*futures, return_exceptions=True)
+        
+        errors = [r for r in results if isinstance(r, Exception)]
+        if errors:
+            print(f"Kafka batch publish error: {len(errors)} of {len(messages)} failed: {errors[0]}")
+        return len(messages) - len(errors)
+    
     async def publish_alert(
         self,
         alert_type: str,
@@ -214,9 +265,16 @@ class KafkaService:
         source: str,
         context: Optional[Dict[str, Any]] = None
     ) -> str:
-        """Publish a log entry."""
-        return await self.publish(
-            topic_key="logs",
+        """Queue a log entry for batched publishing.
+        
+        Entries are flushed by a background task; when the queue is full the
+        entry is dropped rather than blocking the caller.
+        """
+        if not self.producer:
+            raise RuntimeError("Kafka producer not started")
+        
+        entry = KafkaMessage(
+            topic=self.topics.get("logs", "logs"),
             payload={
                 "level": log_level,
                 "message": message,
@@ -227,23 +285,77 @@ class KafkaService:
             tags=[log_level],
             metadata={"level": log_level}
         )
+        
+        try:
+            self._log_queue.put_nowait(entry)
+        except asyncio.QueueFull:
+            self.logs_dropped += 1
+        return entry.id
+    
+    async def _flush_logs_loop(self):
+        """Drain queued log entries in batches until a None sentinel arrives."""
+        stopping = False
+        while not stopping:
+            try:
+                entry = await self._log_queue.get()
+                if entry is None:
+                    return
+                batch = [entry]
+                
+                # Collect more entries until the batch is full or the flush
+                # interval elapses
+                loop = asyncio.get_running_loop()
+                deadline = loop.time() + self.LOG_FLUSH_INTERVAL
+                while len(batch) < self.LOG_BATCH_SIZE:
+                    if self._log_queue.empty():
+                        timeout = deadline - loop.time()
+                        if timeout <= 0:
+                            break
+                        try:
+                            entry = await asyncio.wait_for(self._log_queue.get(), timeout)
+                        except asyncio.TimeoutError:
+                            break
+                    else:
+                        entry = self._log_queue.get_nowait()
+                    if entry is None:
+                        stopping = True
+                        break
+                    batch.append(entry)
+                
+                await self.publish_many(batch)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Log flush error: {e}")
+    
+    async def _flush_pending_logs(self):
+        """Publish all currently queued log entries."""
+        batch = []
+        while not self._log_queue.empty():
+            batch.append(self._log_queue.get_nowait())
+        if batch:
+            try:
+                await self.publish_many(batch)
+            except Exception as e:
+                print(f"Log flush error: {e}")
     
     def register_handler(self, topic_key: str, handler: Callable):
         """Register a message handler for a topic."""
-        topic = self.topics.get(topic_key, topic_key)
+        # Interned keys let the per-message dispatch lookup compare by identity
+        topic = sys.intern(self.topics.get(topic_key, topic_key))
         if topic not in self.handlers:
             self.handlers[topic] = []
         self.handlers[topic].append(handler)
     
     async def start_consumer(self, topic_key: str, group_id: str):
         """Start consuming messages from a topic."""
-        topic = self.topics.get(topic_key, topic_key)
+        topic = sys.intern(self.topics.get(topic_key, topic_key))
         
         consumer = AIOKafkaConsumer(
             topic,
             bootstrap_servers=self.bootstrap_servers,
             group_id=group_id,
-            value_deserializer=lambda m: json.loads(m.decode('utf-8')),
+            value_deserializer=orjson.loads,
             auto_offset_reset='latest'
         )
         
@@ -255,6 +367,7 @@ class KafkaService:
     
     async def _consume_loop(self, topic: str, consumer: AIOKafkaConsumer):
         """Internal consumption loop."""
+        topic = sys.intern(topic)
         try:
             async for msg in consumer:
                 if not self._running:
@@ -276,5 +389,7 @@ class KafkaService:
             "bootstrap_servers": self.bootstrap_servers,
             "topics": list(self.topics.values()),
             "active_consumers": list(self.consumers.keys()),
-            "registered_handlers": {k: len(v) for k, v in self.handlers.items()}
+            "registered_handlers": {k: len(v) for k, v in self.handlers.items()},
+            "pending_logs": self._log_queue.qsize(),
+            "dropped_logs": self.logs_dropped
         }
@@ -1,7 +1,7 @@
 """OpenSearch service for full-text search and vector storage."""
 
 import json
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, AsyncIterator, Union
 from datetime import datetime
 import uuid
 
@@ -9,7 +9,7 @@ from opensearchpy import AsyncOpenSearch, helpers
 
 import sys
 sys.path.append('..')
-from config import settings
+from config import RESOLVED
 
 
 class OpenSearchService:
@@ -24,9 +24,12 @@ class OpenSearchService:
     INDEX_TASKS = "tasks"
     INDEX_VECTORS = "vectors"
     
+    # Largest page returned by a single search; bigger pulls use iter_search
+    MAX_PAGE_SIZE = 1000
+    
     def __init__(self):
-        self.hosts = settings.OPENSEARCH_HOSTS
-        self.prefix = settings.OPENSEARCH_INDEX_PREFIX
+        self.hosts = list(RESOLVED.opensearch_hosts)
+        self.prefix = RESOLVED.opensearch_index_prefix
         self.client: Optional[AsyncOpenSearch] = None
     
     async def connect(self):
@@ -271,9 +274,19 @@ class OpenSearchService:
         query: Dict[str, Any],
         size: int = 10,
         from_: int = 0,
-        sort: Optional[List[Dict]] = None
+        sort: Optional[List[Dict]] = None,
+        track_total_hits: Optional[bool] = None
     ) -> Dict[str, Any]:
-        """Search documents."""
+        """Search documents.
+        
+        Raises ValueError if size exceeds MAX_PAGE_SIZE; use iter_search for
+        larger pulls.
+        """
+        if size > self.MAX_PAGE_SIZE:
+            raise ValueError(
+                f"size {size} exceeds MAX_PAGE_SIZE ({self.MAX_PAGE_SIZE}); use iter_search"
+            )
+        
         full_index = self._index_name(index)
         
         body = {
@@ -284,6 +297,8 @@ class OpenSearchService:
         
         if sort:
             body["sort"] = sort
+        if track_total_hits is not None:
+            body["track_total_hits"] = track_total_hits
         
         result = await self.client.search(index=full_index, body=body)
         
@@ -294,11 +309,70 @@ class OpenSearchService:
             doc["_score"] = hit["_score"]
             hits.append(doc)
         
+        # "total" is omitted from the response when track_total_hits is off
+        total = result["hits"].get("total")
         return {
-            "total": result["hits"]["total"]["value"],
+            "total": total["value"] if total else len(hits),
             "hits": hits
         }
     
+    async def iter_search(
+        self,
+        index: str,
+        query: Dict[str, Any],
+        sort: List[Dict],
+        page_size: int = 500,
+        limit: Optional[int] = None,
+        keep_alive: str = "1m"
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Iterate over all matching documents using a point in time.
+        
+        Pages are fetched with search_after, so memory use stays bounded by
+        page_size regardless of how many documents match. A _shard_doc
+        tiebreaker is appended to the sort when missing, so documents with
+        equal sort values are neither skipped nor repeated across pages.
+        """
+        if not any("_shard_doc" in key for key in sort):
+            sort = [*sort, {"_shard_doc": "asc"}]
+        
+        full_index = self._index_name(index)
+        pit = await self.client.create_pit(index=full_index, keep_alive=keep_alive)
+        pit_id = pit["pit_id"]
+        
+        body = {
+            "query": query,
+            "size": min(page_size, self.MAX_PAGE_SIZE),
+            "sort": sort,
+            "pit": {"id": pit_id, "keep_alive": keep_alive}
+        }
+        yielded = 0
+        
+        try:
+            while True:
+                result = await self.client.search(body=body)
+                page = result["hits"]["hits"]
+                if not page:
+                    return
+                
+                for hit in page:
+                    doc = hit["_source"]
+                    doc["_id"] = hit["_id"]
+                    doc["_score"] = hit["_score"]
+                    yield doc
+                    
+                    yielded += 1
+                    if limit is not None and yielded >= limit:
+                        return
+                
+                # The PIT id may change between pages
+                body["pit"]["id"] = pit_id = result.get("pit_id", pit_id)
+                body["search_after"] = page[-1]["sort"]
+        finally:
+            try:
+                await self.client.delete_pit(body={"pit_id": [pit_id]})
+            except Exception as e:
+                print(f"PIT cleanup error: {e}")
+    
     async def full_text_search(
         self,
         index: str,
@@ -371,20 +445,22 @@ class OpenSearchService:
         limit: int = 50
     ) -> List[Dict[str, Any]]:
         """Get alerts with filters."""
-        must = []
+        # Filter context skips scoring and lets OpenSearch cache the clauses
+        filters = []
         
         if severity:
-            must.append({"term": {"severity": severity}})
+            filters.append({"term": {"severity": severity}})
         if acknowledged is not None:
-            must.append({"term": {"acknowledged": acknowledged}})
+            filters.append({"term": {"acknowledged": acknowledged}})
         
-        query = {"bool": {"must": must}} if must else {"match_all": {}}
+        query = {"bool": {"filter": filters}} if filters else {"match_all": {}}
         
         result = await self.search(
             index=self.INDEX_ALERTS,
             query=query,
             size=limit,
-            sort=[{"created_at": {"order": "desc"}}]
+            sort=[{"created_at": {"order": "desc"}}],
+            track_total_hits=False
         )
         return result["hits"]
     
@@ -397,27 +473,28 @@ class OpenSearchService:
         limit: int = 50
     ) -> List[Dict[str, Any]]:
         """Get shift logs with filters."""
-        must = []
+        filters = []
         
         if operator:
-            must.append({"term": {"operator": operator}})
+            filters.append({"term": {"operator": operator}})
         if status:
-            must.append({"term": {"status": status}})
+            filters.append({"term": {"status": status}})
         if start_date or end_date:
             range_query = {"start_time": {}}
             if start_date:
                 range_query["start_time"]["gte"] = start_date
             if end_date:
                 range_query["start_time"]["lte"] = end_date
-            must.append({"range": range_query})
+            filters.append({"range": range_query})
         
-        query = {"bool": {"must": must}} if must else {"match_all": {}}
+        query = {"bool": {"filter": filters}} if filters else {"match_all": {}}
         
         result = await self.search(
             index=self.INDEX_SHIFT_LOGS,
             query=query,
             size=limit,
-            sort=[{"start_time": {"order": "desc"}}]
+            sort=[{"start_time": {"order": "desc"}}],
+            track_total_hits=False
         )
         return result["hits"]
     
@@ -426,10 +503,16 @@ class OpenSearchService:
         event_type: Optional[str] = None,
         source: Optional[str] = None,
         hours: int = 24,
-        limit: int = 100
-    ) -> List[Dict[str, Any]]:
-        """Get recent events."""
-        must = [
+        limit: int = 100,
+        stream: bool = False
+    ) -> Union[List[Dict[str, Any]], AsyncIterator[Dict[str, Any]]]:
+        """Get recent events.
+        
+        With stream=True an async iterator backed by iter_search is returned
+        instead of a list, for pulls larger than MAX_PAGE_SIZE. Without it,
+        limit must not exceed MAX_PAGE_SIZE.
+        """
+        filters = [
             {
                 "range": {
                     "timestamp": {
@@ -440,15 +523,24 @@ class OpenSearchService:
         ]
         
         if event_type:
-            must.append({"term": {"event_type": event_type}})
+            filters.append({"term": {"event_type": event_type}})
         if source:
-            must.append({"term": {"source": source}})
+            filters.append({"term": {"source": source}})
+        
+        if stream:
+            return self.iter_search(
+                index=self.INDEX_EVENTS,
+                query={"bool": {"filter": filters}},
+                sort=[{"timestamp": {"order": "desc"}}, {"_shard_doc": "asc"}],
+                limit=limit
+            )
         
         result = await self.search(
             index=self.INDEX_EVENTS,
-            query={"bool": {"must": must}},
+            query={"bool": {"filter": filters}},
             size=limit,
-            sort=[{"timestamp": {"order": "desc"}}]
+            sort=[{"timestamp": {"order": "desc"}}],
+            track_total_hits=False
         )
         return result["hits"]
     
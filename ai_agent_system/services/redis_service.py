@@ -1,16 +1,82 @@
 """Redis cache service for session management and hot data."""
 
-import json
 import asyncio
 from typing import Dict, Any, Optional, List, Union
 from datetime import datetime, timedelta
 import hashlib
+import random
+import time
+import uuid
 
+import msgspec
 import redis.asyncio as redis
+import xxhash
+from redis.utils import HIREDIS_AVAILABLE
 
 import sys
 sys.path.append('..')
-from config import settings
+from config import RESOLVED
+
+
+# Shared msgspec codecs; values stay JSON so keys remain readable by other
+# clients and redis-cli
+_ENC = msgspec.json.Encoder()
+_DEC = msgspec.json.Decoder()
+
+# Atomic fixed-window counter: increments and starts the window on first hit
+_RATE_LIMIT_LUA = """
+local count = redis.call('INCR', KEYS[1])
+if count == 1 then
+    redis.call('EXPIRE', KEYS[1], ARGV[1])
+end
+return count
+"""
+
+# Merge fields into an existing session hash; ARGV = extend flag, ttl, then
+# field/value pairs. Missing sessions are left alone.
+_SESSION_UPDATE_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+redis.call('HSET', KEYS[1], unpack(ARGV, 3))
+if ARGV[1] == '1' then
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 1
+"""
+
+# Delete a lock only if it still holds the caller's token
+_LOCK_RELEASE_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# Record an acknowledgement in the alert's sibling ack hash, expiring with
+# the alert body, and drop the id from the active index atomically. The body
+# itself is never rewritten. KEYS = body, ack hash, active index;
+# ARGV = user, timestamp, alert id
+_ALERT_ACK_LUA = """
+local ttl = redis.call('PTTL', KEYS[1])
+if ttl == -2 then
+    return 0
+end
+redis.call('HSET', KEYS[2], 'acknowledged_by', ARGV[1], 'acknowledged_at', ARGV[2])
+if ttl > 0 then
+    redis.call('PEXPIRE', KEYS[2], ttl)
+end
+redis.call('ZREM', KEYS[3], ARGV[3])
+return 1
+"""
+
+
+def _decode_or_text(raw: bytes) -> Any:
+    """Decode a JSON value, falling back to text for plain string values."""
+    try:
+        return _DEC.decode(raw)
+    except msgspec.DecodeError:
+        return raw.decode("utf-8")
 
 
 class RedisService:
@@ -26,39 +92,68 @@ class RedisService:
     PREFIX_ALERT = "alert:"
     
     def __init__(self):
-        self.url = settings.REDIS_URL
-        self.default_ttl = settings.REDIS_CACHE_TTL
+        self.url = RESOLVED.redis_url
+        self.default_ttl = RESOLVED.redis_cache_ttl
+        self.max_connections = RESOLVED.redis_max_connections
+        self.legacy_cache_keys = RESOLVED.redis_legacy_cache_keys
+        
+        # Encoded prefixes for the hottest paths, so keys are built as bytes
+        # without string formatting on every call
+        self._p_cache = self.PREFIX_CACHE.encode()
+        self._p_rate = self.PREFIX_RATE.encode()
+        self.pool: Optional[redis.ConnectionPool] = None
         self.client: Optional[redis.Redis] = None
+        self._rate_limit_script = None
+        self._session_update_script = None
+        self._lock_release_script = None
+        self._alert_ack_script = None
     
     async def connect(self):
         """Connect to Redis."""
-        self.client = redis.from_url(
+        # Replies stay raw bytes; msgspec decodes them directly, so there is no
+        # intermediate str copy per reply
+        self.pool = redis.ConnectionPool.from_url(
             self.url,
+            max_connections=self.max_connections,
             encoding="utf-8",
-            decode_responses=True
+            decode_responses=False
         )
+        self.client = redis.Redis(connection_pool=self.pool)
         await self.client.ping()
-        print(f"Redis connected: {self.url}")
+        self._rate_limit_script = self.client.register_script(_RATE_LIMIT_LUA)
+        self._session_update_script = self.client.register_script(_SESSION_UPDATE_LUA)
+        self._lock_release_script = self.client.register_script(_LOCK_RELEASE_LUA)
+        self._alert_ack_script = self.client.register_script(_ALERT_ACK_LUA)
+        # redis-py picks the hiredis C parser automatically when installed
+        parser = "hiredis" if HIREDIS_AVAILABLE else "python"
+        print(f"Redis connected: {self.url} (parser: {parser})")
     
     async def disconnect(self):
         """Disconnect from Redis."""
         if self.client:
             await self.client.close()
+            # A client built on an explicit pool doesn't close the pool itself
+            await self.pool.disconnect()
             print("Redis disconnected")
     
     # ==================== CACHING ====================
     
     async def cache_get(self, key: str) -> Optional[Any]:
         """Get a cached value."""
-        full_key = f"{self.PREFIX_CACHE}{key}"
+        full_key = self._p_cache + key.encode()
         value = await self.client.get(full_key)
         if value:
-            try:
-                return json.loads(value)
-            except json.JSONDecodeError:
-                return value
+            return _decode_or_text(value)
         return None
     
+    async def cache_mget(self, keys: List[str]) -> List[Optional[Any]]:
+        """Get several cached values in a single round-trip."""
+        if not keys:
+            return []
+        prefix = self._p_cache
+        values = await self.client.mget([prefix + key.encode() for key in keys])
+        return [_decode_or_text(value) if value else None for value in values]
+    
     async def cache_set(
         self,
         key: str,
@@ -66,27 +161,32 @@ class RedisService:
         ttl: Optional[int] = None
     ):
         """Set a cached value."""
-        full_key = f"{self.PREFIX_CACHE}{key}"
+        full_key = self._p_cache + key.encode()
         if isinstance(value, (dict, list)):
-            value = json.dumps(value)
+            value = _ENC.encode(value)
         await self.client.set(full_key, value, ex=ttl or self.default_ttl)
     
     async def cache_delete(self, key: str):
         """Delete a cached value."""
-        full_key = f"{self.PREFIX_CACHE}{key}"
+        full_key = self._p_cache + key.encode()
         await self.client.delete(full_key)
     
     async def cache_exists(self, key: str) -> bool:
         """Check if a cache key exists."""
-        full_key = f"{self.PREFIX_CACHE}{key}"
+        full_key = self._p_cache + key.encode()
         return await self.client.exists(full_key) > 0
     
     def cache_key(self, *args) -> str:
         """Generate a cache key from arguments."""
-        key_str = ":".join(str(a) for a in args)
-        return hashlib.md5(key_str.encode()).hexdigest()
+        key_str = ":".join(map(str, args))
+        if self.legacy_cache_keys:
+            # md5 keys, for reading caches written before the xxhash switch
+            return hashlib.md5(key_str.encode()).hexdigest()
+        return xxhash.xxh3_64_hexdigest(key_str)
     
     # ==================== SESSIONS ====================
+    # Sessions are hashes with one msgspec-encoded value per field, so updates
+    # only rewrite the fields that changed.
     
     async def session_create(
         self,
@@ -96,32 +196,41 @@ class RedisService:
     ):
         """Create a new session."""
         full_key = f"{self.PREFIX_SESSION}{session_id}"
-        data["created_at"] = datetime.utcnow().isoformat()
-        data["last_activity"] = datetime.utcnow().isoformat()
-        await self.client.set(full_key, json.dumps(data), ex=ttl)
+        now = datetime.utcnow().isoformat()
+        data["created_at"] = now
+        data["last_activity"] = now
+        
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.delete(full_key)
+            pipe.hset(full_key, mapping={k: _ENC.encode(v) for k, v in data.items()})
+            pipe.expire(full_key, ttl)
+            await pipe.execute()
     
     async def session_get(self, session_id: str) -> Optional[Dict[str, Any]]:
         """Get session data."""
         full_key = f"{self.PREFIX_SESSION}{session_id}"
-        value = await self.client.get(full_key)
-        if value:
-            return json.loads(value)
+        fields = await self.client.hgetall(full_key)
+        if fields:
+            return {k.decode(): _DEC.decode(v) for k, v in fields.items()}
         return None
     
     async def session_update(
         self,
         session_id: str,
         data: Dict[str, Any],
-        extend_ttl: bool = True
+        extend_ttl: bool = True,
+        ttl: int = 86400
     ):
-        """Update session data."""
+        """Update session data, resetting its TTL when extend_ttl is set."""
         full_key = f"{self.PREFIX_SESSION}{session_id}"
-        existing = await self.session_get(session_id)
-        if existing:
-            existing.update(data)
-            existing["last_activity"] = datetime.utcnow().isoformat()
-            ttl = await self.client.ttl(full_key) if extend_ttl else None
-            await self.client.set(full_key, json.dumps(existing), ex=ttl or 86400)
+        fields = dict(data)
+        fields["last_activity"] = datetime.utcnow().isoformat()
+        
+        args = [1 if extend_ttl else 0, ttl]
+        for k, v in fields.items():
+            args.append(k)
+            args.append(_ENC.encode(v))
+        await self._session_update_script(keys=[full_key], args=args)
     
     async def session_delete(self, session_id: str):
         """Delete a session."""
@@ -137,23 +246,16 @@ class RedisService:
         window_seconds: int
     ) -> tuple[bool, int]:
         """Check rate limit. Returns (allowed, remaining)."""
-        full_key = f"{self.PREFIX_RATE}{identifier}"
-        
-        current = await self.client.get(full_key)
-        if current is None:
-            await self.client.set(full_key, 1, ex=window_seconds)
-            return True, limit - 1
+        full_key = self._p_rate + identifier.encode()
         
-        count = int(current)
-        if count >= limit:
-            return False, 0
-        
-        await self.client.incr(full_key)
-        return True, limit - count - 1
+        # Single atomic round-trip; concurrent callers can't both slip past
+        # the limit between a read and a write
+        count = int(await self._rate_limit_script(keys=[full_key], args=[window_seconds]))
+        return count <= limit, max(0, limit - count)
     
     async def rate_limit_reset(self, identifier: str):
         """Reset rate limit for an identifier."""
-        full_key = f"{self.PREFIX_RATE}{identifier}"
+        full_key = self._p_rate + identifier.encode()
         await self.client.delete(full_key)
     
     # ==================== DISTRIBUTED LOCKS ====================
@@ -161,16 +263,43 @@ class RedisService:
     async def lock_acquire(
         self,
         lock_name: str,
-        ttl: int = 30
-    ) -> bool:
-        """Acquire a distributed lock."""
+        ttl: int = 30,
+        wait: float = 0,
+        base: float = 0.005,
+        cap: float = 0.25
+    ) -> Optional[str]:
+        """Acquire a distributed lock.
+        
+        Retries for up to `wait` seconds with jittered exponential backoff
+        (starting at `base`, capped at `cap`). Returns the owner token on
+        success or None if the lock could not be taken.
+        """
         full_key = f"{self.PREFIX_LOCK}{lock_name}"
-        return await self.client.set(full_key, "1", nx=True, ex=ttl)
-    
-    async def lock_release(self, lock_name: str):
-        """Release a distributed lock."""
+        token = uuid.uuid4().hex
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + wait
+        attempt = 0
+        
+        while True:
+            if await self.client.set(full_key, token, nx=True, ex=ttl):
+                return token
+            
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return None
+            
+            delay = min(cap, base * 2 ** attempt) * (0.5 + random.random())
+            await asyncio.sleep(min(delay, remaining))
+            attempt += 1
+    
+    async def lock_release(self, lock_name: str, token: str) -> bool:
+        """Release a distributed lock if it is still owned by `token`.
+        
+        `token` is the value returned by lock_acquire.
+        """
         full_key = f"{self.PREFIX_LOCK}{lock_name}"
-        await self.client.delete(full_key)
+        released = await self._lock_release_script(keys=[full_key], args=[token])
+        return bool(released)
     
     async def lock_extend(self, lock_name: str, ttl: int = 30) -> bool:
         """Extend a lock's TTL."""
@@ -183,7 +312,7 @@ class RedisService:
         """Push an item to a queue."""
         full_key = f"{self.PREFIX_QUEUE}{queue_name}"
         if isinstance(item, (dict, list)):
-            item = json.dumps(item)
+            item = _ENC.encode(item)
         await self.client.rpush(full_key, item)
     
     async def queue_pop(self, queue_name: str, timeout: int = 0) -> Optional[Any]:
@@ -193,17 +322,11 @@ class RedisService:
             result = await self.client.blpop(full_key, timeout=timeout)
             if result:
                 _, value = result
-                try:
-                    return json.loads(value)
-                except json.JSONDecodeError:
-                    return value
+                return _decode_or_text(value)
         else:
             value = await self.client.lpop(full_key)
             if value:
-                try:
-                    return json.loads(value)
-                except json.JSONDecodeError:
-                    return value
+                return _decode_or_text(value)
         return None
     
     async def queue_length(self, queue_name: str) -> int:
@@ -221,14 +344,14 @@ class RedisService:
         """Set agent state."""
         full_key = f"{self.PREFIX_AGENT}{agent_id}:state"
         state["updated_at"] = datetime.utcnow().isoformat()
-        await self.client.set(full_key, json.dumps(state))
+        await self.client.set(full_key, _ENC.encode(state))
     
     async def agent_get_state(self, agent_id: str) -> Optional[Dict[str, Any]]:
         """Get agent state."""
         full_key = f"{self.PREFIX_AGENT}{agent_id}:state"
         value = await self.client.get(full_key)
         if value:
-            return json.loads(value)
+            return _DEC.decode(value)
         return None
     
     async def agent_add_history(
@@ -240,8 +363,10 @@ class RedisService:
         """Add to agent conversation history."""
         full_key = f"{self.PREFIX_AGENT}{agent_id}:history"
         entry["timestamp"] = datetime.utcnow().isoformat()
-        await self.client.rpush(full_key, json.dumps(entry))
-        await self.client.ltrim(full_key, -max_entries, -1)
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.rpush(full_key, _ENC.encode(entry))
+            pipe.ltrim(full_key, -max_entries, -1)
+            await pipe.execute()
     
     async def agent_get_history(
         self,
@@ -251,7 +376,7 @@ class RedisService:
         """Get agent conversation history."""
         full_key = f"{self.PREFIX_AGENT}{agent_id}:history"
         entries = await self.client.lrange(full_key, -limit, -1)
-        return [json.loads(e) for e in entries]
+        return [_DEC.decode(e) for e in entries]
     
     # ==================== ALERTS ====================
     
@@ -263,40 +388,66 @@ class RedisService:
     ):
         """Store an alert."""
         full_key = f"{self.PREFIX_ALERT}{alert_id}"
-        alert_data["stored_at"] = datetime.utcnow().isoformat()
-        await self.client.set(full_key, json.dumps(alert_data), ex=ttl)
+        now = time.time()
+        alert_data["stored_at"] = datetime.utcfromtimestamp(now).isoformat()
         
-        # Add to active alerts set
-        await self.client.sadd(f"{self.PREFIX_ALERT}active", alert_id)
+        # Body and active index (scored by expiry time) in one round trip
+        pipe = self.client.pipeline(transaction=False)
+        pipe.set(full_key, _ENC.encode(alert_data), ex=ttl)
+        pipe.delete(f"{full_key}:ack")
+        pipe.zadd(f"{self.PREFIX_ALERT}active", {alert_id: now + ttl})
+        await pipe.execute()
     
     async def alert_get(self, alert_id: str) -> Optional[Dict[str, Any]]:
-        """Get an alert."""
+        """Get an alert, merged with its acknowledgement if any."""
         full_key = f"{self.PREFIX_ALERT}{alert_id}"
-        value = await self.client.get(full_key)
-        if value:
-            return json.loads(value)
-        return None
+        pipe = self.client.pipeline(transaction=False)
+        pipe.get(full_key)
+        pipe.hgetall(f"{full_key}:ack")
+        value, ack = await pipe.execute()
+        if not value:
+            return None
+        
+        alert = _DEC.decode(value)
+        if ack:
+            alert["acknowledged"] = True
+            alert.update({k.decode(): v.decode() for k, v in ack.items()})
+        return alert
     
     async def alert_acknowledge(self, alert_id: str, user: str):
         """Acknowledge an alert."""
-        alert = await self.alert_get(alert_id)
-        if alert:
-            alert["acknowledged"] = True
-            alert["acknowledged_by"] = user
-            alert["acknowledged_at"] = datetime.utcnow().isoformat()
-            await self.client.set(
-                f"{self.PREFIX_ALERT}{alert_id}",
-                json.dumps(alert)
-            )
-            await self.client.srem(f"{self.PREFIX_ALERT}active", alert_id)
-    
-    async def alert_get_active(self) -> List[Dict[str, Any]]:
-        """Get all active alerts."""
-        alert_ids = await self.client.smembers(f"{self.PREFIX_ALERT}active")
+        full_key = f"{self.PREFIX_ALERT}{alert_id}"
+        await self._alert_ack_script(
+            keys=[full_key, f"{full_key}:ack", f"{self.PREFIX_ALERT}active"],
+            args=[user, datetime.utcnow().isoformat(), alert_id]
+        )
+    
+    async def alert_get_active(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Get active alerts, latest expiry first.
+        
+        Returns every unexpired alert unless `limit` is given.
+        """
+        active_key = f"{self.PREFIX_ALERT}active"
+        now = time.time()
+        
+        # Trim ids whose alert has expired so the index stays bounded
+        pipe = self.client.pipeline(transaction=False)
+        pipe.zremrangebyscore(active_key, "-inf", now)
+        if limit is None:
+            pipe.zrevrangebyscore(active_key, "+inf", now)
+        else:
+            pipe.zrevrangebyscore(active_key, "+inf", now, start=0, num=limit)
+        _, raw_ids = await pipe.execute()
+        alert_ids = [aid.decode() for aid in raw_ids]
+        if not alert_ids:
+            return []
+        
+        # One MGET for all bodies instead of a GET per alert
+        values = await self.client.mget([f"{self.PREFIX_ALERT}{aid}" for aid in alert_ids])
         alerts = []
-        for aid in alert_ids:
-            alert = await self.alert_get(aid)
-            if alert:
+        for aid, value in zip(alert_ids, values):
+            if value:
+                alert = _DEC.decode(value)
                 alert["id"] = aid
                 alerts.append(alert)
         return alerts
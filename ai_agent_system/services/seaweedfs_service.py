@@ -1,41 +1,82 @@
 """SeaweedFS distributed storage service."""
 
-import json
+import asyncio
+import time
 import aiohttp
-from typing import Dict, Any, Optional, List, BinaryIO
+import orjson
+from aiohttp.payload import AsyncIterablePayload
+from typing import Dict, Any, Optional, List, BinaryIO, AsyncIterable, AsyncIterator, Union, Tuple
 from datetime import datetime
 import uuid
 import os
 
 import sys
 sys.path.append('..')
-from config import settings
+from config import RESOLVED
 
 
 class SeaweedFSService:
     """SeaweedFS service for distributed file storage."""
     
+    # Chunk size for streamed downloads
+    DOWNLOAD_CHUNK_SIZE = 64 * 1024
+    
+    # How long a volume id -> volume server mapping is trusted
+    VOLUME_CACHE_TTL = 60.0
+    
     def __init__(self):
-        self.master_url = settings.SEAWEEDFS_MASTER
-        self.filer_url = settings.SEAWEEDFS_FILER
+        self.master_url = RESOLVED.seaweedfs_master
+        self.filer_url = RESOLVED.seaweedfs_filer
         self.session: Optional[aiohttp.ClientSession] = None
+        self._vol_cache: Dict[str, Tuple[str, float]] = {}
+        self.ready_event = asyncio.Event()
+        self._probe_task: Optional[asyncio.Task] = None
     
     async def connect(self):
         """Initialize HTTP session."""
-        self.session = aiohttp.ClientSession()
+        # Every upload talks to both master and volume server, so keep warm
+        # keep-alive connections to each and cache their DNS lookups
+        connector = aiohttp.TCPConnector(
+            limit=128,
+            limit_per_host=64,
+            ttl_dns_cache=300,
+            keepalive_timeout=60,
+            enable_cleanup_closed=True
+        )
+        # No total timeout: streamed transfers of large files may run long
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=None, connect=5, sock_read=30),
+            json_serialize=lambda obj: orjson.dumps(obj).decode()
+        )
         
-        # Test connection
+        # Test connection in the background so startup does not wait on the master
+        self._probe_task = asyncio.create_task(self._probe())
+    
+    async def _probe(self):
+        """Check the master is reachable and set ready_event on success."""
         try:
             async with self.session.get(f"{self.master_url}/cluster/status") as resp:
                 if resp.status == 200:
+                    self.ready_event.set()
                     print(f"SeaweedFS connected: {self.master_url}")
                 else:
                     print(f"SeaweedFS connection warning: status {resp.status}")
         except Exception as e:
             print(f"SeaweedFS connection error: {e}")
     
+    async def wait_ready(self, timeout: float = 0.5) -> bool:
+        """Wait briefly for the connection probe to succeed."""
+        try:
+            await asyncio.wait_for(self.ready_event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+    
     async def disconnect(self):
         """Close HTTP session."""
+        if self._probe_task and not self._probe_task.done():
+            self._probe_task.cancel()
         if self.session:
             await self.session.close()
             print("SeaweedFS disconnected")
@@ -44,20 +85,57 @@ class SeaweedFSService:
     
     async def upload_file(
         self,
-        file_content: bytes,
+        file_content: Union[bytes, BinaryIO, AsyncIterable[bytes]],
         filename: str,
         path: str = "/",
-        metadata: Optional[Dict[str, Any]] = None
+        metadata: Optional[Dict[str, Any]] = None,
+        size: Optional[int] = None
     ) -> Dict[str, Any]:
-        """Upload a file to SeaweedFS."""
+        """Upload a file to SeaweedFS.
+        
+        file_content may be bytes, an open binary file or an async iterable
+        of chunks; the latter two are streamed to the volume server without
+        being buffered in memory. Pass `size` for non-bytes content when known.
+        """
         # Get file ID from master
-        async with self.session.get(f"{self.master_url}/dir/assign") as resp:
+        fids, volume_url = await self._assign_batch(1)
+        return await self._upload_assigned(
+            fids[0], volume_url, file_content, filename, path, metadata, size
+        )
+    
+    async def _assign_batch(self, n: int) -> Tuple[List[str], str]:
+        """Reserve n file IDs on one volume with a single master request.
+        
+        The master returns one fid; the others are derived as fid_1 .. fid_{n-1}.
+        """
+        async with self.session.get(
+            f"{self.master_url}/dir/assign",
+            params={"count": n}
+        ) as resp:
             if resp.status != 200:
                 raise Exception(f"Failed to get file ID: {resp.status}")
-            assign_data = await resp.json()
+            assign_data = orjson.loads(await resp.read())
         
         fid = assign_data["fid"]
         volume_url = f"http://{assign_data['url']}"
+        self._vol_cache[fid.split(",")[0]] = (volume_url, time.monotonic())
+        return [fid] + [f"{fid}_{i}" for i in range(1, n)], volume_url
+    
+    async def _upload_assigned(
+        self,
+        fid: str,
+        volume_url: str,
+        file_content: Union[bytes, BinaryIO, AsyncIterable[bytes]],
+        filename: str,
+        path: str = "/",
+        metadata: Optional[Dict[str, Any]] = None,
+        size: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """Upload content to an already assigned FID."""
+        if isinstance(file_content, (bytes, bytearray, memoryview)):
+            size = len(file_content)
+        elif not hasattr(file_content, "read"):
+            file_content = AsyncIterablePayload(file_content)
         
         # Upload to volume server
         form = aiohttp.FormData()
@@ -71,7 +149,7 @@ class SeaweedFSService:
         async with self.session.post(f"{volume_url}/{fid}", data=form) as resp:
             if resp.status != 201:
                 raise Exception(f"Upload failed: {resp.status}")
-            upload_result = await resp.json()
+            upload_result = orjson.loads(await resp.read())
         
         # Store metadata in filer
         full_path = os.path.join(path, filename)
@@ -79,7 +157,7 @@ class SeaweedFSService:
             "fid": fid,
             "filename": filename,
             "path": full_path,
-            "size": upload_result.get("size", len(file_content)),
+            "size": upload_result.get("size", size),
             "uploaded_at": datetime.utcnow().isoformat(),
             "metadata": metadata or {}
         }
@@ -103,54 +181,80 @@ class SeaweedFSService:
         """Upload a file from local path."""
         filename = os.path.basename(local_path)
         
+        # Hand the open file to aiohttp so it is streamed from disk in chunks
         with open(local_path, 'rb') as f:
-            content = f.read()
-        
-        return await self.upload_file(content, filename, remote_path, metadata)
+            return await self.upload_file(
+                f, filename, remote_path, metadata,
+                size=os.path.getsize(local_path)
+            )
     
     async def download_file(self, fid: str) -> bytes:
         """Download a file by FID."""
-        # Lookup volume location
-        async with self.session.get(
-            f"{self.master_url}/dir/lookup",
-            params={"volumeId": fid.split(",")[0]}
-        ) as resp:
-            if resp.status != 200:
-                raise Exception(f"Lookup failed: {resp.status}")
-            lookup_data = await resp.json()
-        
-        volume_url = f"http://{lookup_data['locations'][0]['url']}"
+        content = bytearray()
+        async for chunk in self.download_stream(fid):
+            content += chunk
+        return bytes(content)
+    
+    async def download_stream(self, fid: str) -> AsyncIterator[bytes]:
+        """Stream a file by FID in chunks without buffering it whole."""
+        volume_url = await self._resolve_volume(fid)
         
         # Download from volume
         async with self.session.get(f"{volume_url}/{fid}") as resp:
             if resp.status != 200:
+                self._invalidate_volume(fid)
                 raise Exception(f"Download failed: {resp.status}")
-            return await resp.read()
+            async for chunk in resp.content.iter_chunked(self.DOWNLOAD_CHUNK_SIZE):
+                yield chunk
     
     async def download_by_path(self, path: str) -> bytes:
         """Download a file by path from filer."""
+        content = bytearray()
+        async for chunk in self.download_stream_by_path(path):
+            content += chunk
+        return bytes(content)
+    
+    async def download_stream_by_path(self, path: str) -> AsyncIterator[bytes]:
+        """Stream a file by path from filer in chunks."""
         async with self.session.get(f"{self.filer_url}{path}") as resp:
             if resp.status != 200:
                 raise Exception(f"Download failed: {resp.status}")
-            return await resp.read()
+            async for chunk in resp.content.iter_chunked(self.DOWNLOAD_CHUNK_SIZE):
+                yield chunk
     
     async def delete_file(self, fid: str):
         """Delete a file by FID."""
+        volume_url = await self._resolve_volume(fid)
+        
+        # Delete from volume
+        async with self.session.delete(f"{volume_url}/{fid}") as resp:
+            if resp.status not in [200, 202, 204]:
+                self._invalidate_volume(fid)
+                raise Exception(f"Delete failed: {resp.status}")
+    
+    async def _resolve_volume(self, fid: str) -> str:
+        """Get the volume server URL for a FID, using the lookup cache."""
+        volume_id = fid.split(",")[0]
+        cached = self._vol_cache.get(volume_id)
+        if cached and time.monotonic() - cached[1] < self.VOLUME_CACHE_TTL:
+            return cached[0]
+        
         # Lookup volume location
         async with self.session.get(
             f"{self.master_url}/dir/lookup",
-            params={"volumeId": fid.split(",")[0]}
+            params={"volumeId": volume_id}
         ) as resp:
             if resp.status != 200:
                 raise Exception(f"Lookup failed: {resp.status}")
-            lookup_data = await resp.json()
+            lookup_data = orjson.loads(await resp.read())
         
         volume_url = f"http://{lookup_data['locations'][0]['url']}"
-        
-        # Delete from volume
-        async with self.session.delete(f"{volume_url}/{fid}") as resp:
-            if resp.status not in [200, 202, 204]:
-                raise Exception(f"Delete failed: {resp.status}")
+        self._vol_cache[volume_id] = (volume_url, time.monotonic())
+        return volume_url
+    
+    def _invalidate_volume(self, fid: str):
+        """Drop a cached volume location after a failed volume request."""
+        self._vol_cache.pop(fid.split(",")[0], None)
     
     async def delete_by_path(self, path: str):
         """Delete a file by path from filer."""
@@ -173,7 +277,7 @@ class SeaweedFSService:
         ) as resp:
             if resp.status != 200:
                 return []
-            data = await resp.json()
+            data = orjson.loads(await resp.read())
             return data.get("Entries", [])
     
     async def create_directory(self, path: str):
@@ -207,7 +311,7 @@ class SeaweedFSService:
         ) as resp:
             if resp.status != 200:
                 return None
-            return await resp.json()
+            return orjson.loads(await resp.read())
     
     async def set_file_metadata(
         self,
@@ -231,29 +335,47 @@ class SeaweedFSService:
     
     async def upload_batch(
         self,
-        files: List[Dict[str, Any]]
+        files: List[Dict[str, Any]],
+        max_concurrency: int = 16
     ) -> List[Dict[str, Any]]:
-        """Upload multiple files.
+        """Upload multiple files concurrently.
         
         files: List of dicts with 'content', 'filename', 'path', 'metadata'
         """
-        results = []
-        for file_info in files:
-            try:
-                result = await self.upload_file(
-                    file_content=file_info["content"],
-                    filename=file_info["filename"],
-                    path=file_info.get("path", "/"),
-                    metadata=file_info.get("metadata")
-                )
-                results.append({"success": True, **result})
-            except Exception as e:
-                results.append({
-                    "success": False,
-                    "filename": file_info["filename"],
-                    "error": str(e)
-                })
-        return results
+        if not files:
+            return []
+        
+        # One master round trip reserves IDs for the whole batch
+        try:
+            fids, volume_url = await self._assign_batch(len(files))
+        except Exception as e:
+            return [
+                {"success": False, "filename": f["filename"], "error": str(e)}
+                for f in files
+            ]
+        
+        sem = asyncio.Semaphore(max_concurrency)
+        
+        async def _upload_one(fid: str, file_info: Dict[str, Any]) -> Dict[str, Any]:
+            async with sem:
+                try:
+                    result = await self._upload_assigned(
+                        fid,
+                        volume_url,
+                        file_content=file_info["content"],
+                        filename=file_info["filename"],
+                        path=file_info.get("path", "/"),
+                        metadata=file_info.get("metadata")
+                    )
+                    return {"success": True, **result}
+                except Exception as e:
+                    return {
+                        "success": False,
+                        "filename": file_info["filename"],
+                        "error": str(e)
+                    }
+        
+        return await asyncio.gather(*[_upload_one(fid, f) for fid, f in zip(fids, files)])
     
     # ==================== STATS ====================
     
@@ -262,14 +384,14 @@ class SeaweedFSService:
         async with self.session.get(f"{self.master_url}/cluster/status") as resp:
             if resp.status != 200:
                 return {"error": f"Status {resp.status}"}
-            return await resp.json()
+            return orjson.loads(await resp.read())
     
     async def get_volume_status(self) -> Dict[str, Any]:
         """Get volume server status."""
         async with self.session.get(f"{self.master_url}/vol/status") as resp:
             if resp.status != 200:
                 return {"error": f"Status {resp.status}"}
-            return await resp.json()
+            return orjson.loads(await resp.read())
     
     async def get_stats(self) -> Dict[str, Any]:
         """Get SeaweedFS statistics."""
@@ -1,13 +1,18 @@
 """Apache Tika service for document processing and extraction."""
 
+import asyncio
+import aiofiles
 import aiohttp
-from typing import Dict, Any, Optional, List
+import magic
+import orjson
+import xxhash
+from collections import OrderedDict
+from typing import Dict, Any, Optional, List, AsyncIterator, AsyncIterable, Union
 from datetime import datetime
-import json
 
 import sys
 sys.path.append('..')
-from config import settings
+from config import RESOLVED
 
 
 class TikaService:
@@ -43,16 +48,59 @@ class TikaService:
         "gz": "application/gzip"
     }
     
+    # Chunk size for streaming local files to the server
+    READ_CHUNK_SIZE = 64 * 1024
+    
+    # Reusable read buffers; also caps concurrent file reads
+    READ_BUFFER_COUNT = 16
+    
+    # Number of extraction results kept for repeated documents
+    EXTRACT_CACHE_SIZE = 1024
+    
+    # Documents larger than this are hashed in a worker thread
+    HASH_OFFLOAD_BYTES = 1024 * 1024
+    
+    # Leading bytes handed to libmagic for local type detection
+    MAGIC_SNIFF_BYTES = 8192
+    
     def __init__(self):
-        self.server_url = settings.TIKA_SERVER
+        self.server_url = RESOLVED.tika_server
+        self.max_connections = RESOLVED.tika_max_conn
         self.session: Optional[aiohttp.ClientSession] = None
+        
+        # Endpoint URLs, built once
+        self._tika_url = f"{self.server_url}/tika"
+        self._meta_url = f"{self.server_url}/meta"
+        self._rmeta_url = f"{self.server_url}/rmeta/text"
+        self._language_url = f"{self.server_url}/language/stream"
+        self._detect_url = f"{self.server_url}/detect/stream"
+        
+        self._buf_pool: asyncio.Queue = asyncio.Queue()
+        for _ in range(self.READ_BUFFER_COUNT):
+            self._buf_pool.put_nowait(bytearray(self.READ_CHUNK_SIZE))
+        
+        # Content hash -> extract_all result, least recently used first
+        self._extract_cache: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+        self.extract_cache_hits = 0
     
     async def connect(self):
         """Initialize HTTP session and test connection."""
-        self.session = aiohttp.ClientSession()
+        # Keep warm connections to the Tika server for batch and OCR bursts
+        connector = aiohttp.TCPConnector(
+            limit=0,
+            limit_per_host=self.max_connections,
+            keepalive_timeout=75,
+            ttl_dns_cache=300,
+            enable_cleanup_closed=True
+        )
+        # No total timeout: OCR of large documents may run long
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=5, sock_read=120)
+        )
         
         try:
-            async with self.session.get(f"{self.server_url}/tika") as resp:
+            async with self.session.get(self._tika_url) as resp:
                 if resp.status == 200:
                     print(f"Tika connected: {self.server_url}")
                 else:
@@ -66,11 +114,31 @@ class TikaService:
             await self.session.close()
             print("Tika disconnected")
     
+    def _guess_mime(self, file_path: str) -> Optional[str]:
+        """Map a file extension to its MIME type."""
+        return self.SUPPORTED_TYPES.get(file_path.rpartition('.')[2].lower())
+    
+    async def _stream_file(self, file_path: str) -> AsyncIterator[memoryview]:
+        """Read a local file in chunks without blocking the event loop.
+        
+        Chunks are views into a pooled buffer and are only valid until the
+        next one is requested; aiohttp copies each into its chunked-encoding
+        frame before asking for more.
+        """
+        buf = await self._buf_pool.get()
+        try:
+            view = memoryview(buf)
+            async with aiofiles.open(file_path, 'rb') as f:
+                while n := await f.readinto(buf):
+                    yield view[:n]
+        finally:
+            self._buf_pool.put_nowait(buf)
+    
     # ==================== TEXT EXTRACTION ====================
     
     async def extract_text(
         self,
-        content: bytes,
+        content: Union[bytes, AsyncIterable[bytes]],
         content_type: Optional[str] = None
     ) -> str:
         """Extract plain text from a document."""
@@ -81,7 +149,7 @@ class TikaService:
             headers["Content-Type"] = content_type
         
         async with self.session.put(
-            f"{self.server_url}/tika",
+            self._tika_url,
             data=content,
             headers=headers
         ) as resp:
@@ -94,20 +162,15 @@ class TikaService:
         file_path: str
     ) -> str:
         """Extract text from a local file."""
-        with open(file_path, 'rb') as f:
-            content = f.read()
-        
-        # Detect content type from extension
-        ext = file_path.split('.')[-1].lower()
-        content_type = self.SUPPORTED_TYPES.get(ext)
+        content = self._stream_file(file_path)
         
-        return await self.extract_text(content, content_type)
+        return await self.extract_text(content, self._guess_mime(file_path))
     
     # ==================== METADATA EXTRACTION ====================
     
     async def extract_metadata(
         self,
-        content: bytes,
+        content: Union[bytes, AsyncIterable[bytes]],
         content_type: Optional[str] = None
     ) -> Dict[str, Any]:
         """Extract metadata from a document."""
@@ -118,35 +181,63 @@ class TikaService:
             headers["Content-Type"] = content_type
         
         async with self.session.put(
-            f"{self.server_url}/meta",
+            self._meta_url,
             data=content,
             headers=headers
         ) as resp:
             if resp.status != 200:
                 raise Exception(f"Metadata extraction failed: {resp.status}")
-            return await resp.json()
+            return orjson.loads(await resp.read())
     
     async def extract_metadata_from_file(
         self,
         file_path: str
     ) -> Dict[str, Any]:
         """Extract metadata from a local file."""
-        with open(file_path, 'rb') as f:
-            content = f.read()
-        
-        ext = file_path.split('.')[-1].lower()
-        content_type = self.SUPPORTED_TYPES.get(ext)
+        content = self._stream_file(file_path)
         
-        return await self.extract_metadata(content, content_type)
+        return await self.extract_metadata(content, self._guess_mime(file_path))
     
     # ==================== FULL EXTRACTION ====================
     
     async def extract_all(
         self,
-        content: bytes,
+        content: Union[bytes, AsyncIterable[bytes]],
         content_type: Optional[str] = None
     ) -> Dict[str, Any]:
-        """Extract both text and metadata from a document."""
+        """Extract both text and metadata from a document.
+        
+        Results for in-memory content are cached by content hash, so a
+        re-submitted document skips the Tika round trip.
+        """
+        cache_key = None
+        if isinstance(content, (bytes, bytearray, memoryview)):
+            if len(content) > self.HASH_OFFLOAD_BYTES:
+                digest = await asyncio.to_thread(xxhash.xxh3_128_hexdigest, content)
+            else:
+                digest = xxhash.xxh3_128_hexdigest(content)
+            cache_key = (digest, content_type)
+            cached = self._extract_cache.get(cache_key)
+            if cached is not None:
+                self._extract_cache.move_to_end(cache_key)
+                self.extract_cache_hits += 1
+                return dict(cached)
+        
+        result = await self._extract_all(content, content_type)
+        
+        if cache_key is not None:
+            self._extract_cache[cache_key] = result
+            if len(self._extract_cache) > self.EXTRACT_CACHE_SIZE:
+                self._extract_cache.popitem(last=False)
+            return dict(result)
+        return result
+    
+    async def _extract_all(
+        self,
+        content: Union[bytes, AsyncIterable[bytes]],
+        content_type: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Send a document to Tika's /rmeta/text endpoint and normalize the result."""
         headers = {
             "Accept": "application/json"
         }
@@ -154,13 +245,13 @@ class TikaService:
             headers["Content-Type"] = content_type
         
         async with self.session.put(
-            f"{self.server_url}/rmeta/text",
+            self._rmeta_url,
             data=content,
             headers=headers
         ) as resp:
             if resp.status != 200:
                 raise Exception(f"Full extraction failed: {resp.status}")
-            data = await resp.json()
+            data = orjson.loads(await resp.read())
             
             # Tika returns a list, get first item
             if isinstance(data, list) and len(data) > 0:
@@ -187,13 +278,11 @@ class TikaService:
         file_path: str
     ) -> Dict[str, Any]:
         """Extract all from a local file."""
-        with open(file_path, 'rb') as f:
-            content = f.read()
+        content = self._stream_file(file_path)
         
-        ext = file_path.split('.')[-1].lower()
-        content_type = self.SUPPORTED_TYPES.get(ext)
+        ext = file_path.rpartition('.')[2].lower()
         
-        result = await self.extract_all(content, content_type)
+        result = await self.extract_all(content, self.SUPPORTED_TYPES.get(ext))
         result["file_path"] = file_path
         result["file_extension"] = ext
         
@@ -214,7 +303,7 @@ class TikaService:
         }
         
         async with self.session.put(
-            f"{self.server_url}/tika",
+            self._tika_url,
             data=image_content,
             headers=headers
         ) as resp:
@@ -234,7 +323,7 @@ class TikaService:
         }
         
         async with self.session.put(
-            f"{self.server_url}/tika",
+            self._tika_url,
             data=pdf_content,
             headers=headers
         ) as resp:
@@ -257,7 +346,7 @@ class TikaService:
             headers["Content-Type"] = content_type
         
         async with self.session.put(
-            f"{self.server_url}/language/stream",
+            self._language_url,
             data=content,
             headers=headers
         ) as resp:
@@ -271,9 +360,17 @@ class TikaService:
         self,
         content: bytes
     ) -> str:
-        """Detect the content type of a document."""
+        """Detect the content type of a document.
+        
+        libmagic identifies most formats locally from the leading bytes; Tika
+        is only asked when it cannot tell.
+        """
+        mime = magic.from_buffer(content[:self.MAGIC_SNIFF_BYTES], mime=True)
+        if mime and mime != "application/octet-stream":
+            return mime
+        
         async with self.session.put(
-            f"{self.server_url}/detect/stream",
+            self._detect_url,
             data=content,
             headers={"Accept": "text/plain"}
         ) as resp:
@@ -285,29 +382,33 @@ class TikaService:
     
     async def process_batch(
         self,
-        files: List[Dict[str, Any]]
+        files: List[Dict[str, Any]],
+        max_concurrency: int = 16
     ) -> List[Dict[str, Any]]:
-        """Process multiple files.
+        """Process multiple files concurrently.
         
         files: List of dicts with 'content', 'filename', 'content_type'
         """
-        results = []
-        for file_info in files:
-            try:
-                result = await self.extract_all(
-                    content=file_info["content"],
-                    content_type=file_info.get("content_type")
-                )
-                result["filename"] = file_info.get("filename", "unknown")
-                result["success"] = True
-                results.append(result)
-            except Exception as e:
-                results.append({
-                    "filename": file_info.get("filename", "unknown"),
-                    "success": False,
-                    "error": str(e)
-                })
-        return results
+        sem = asyncio.Semaphore(max_concurrency)
+        
+        async def _process_one(file_info: Dict[str, Any]) -> Dict[str, Any]:
+            async with sem:
+                try:
+                    result = await self.extract_all(
+                        content=file_info["content"],
+                        content_type=file_info.get("content_type")
+                    )
+                    result["filename"] = file_info.get("filename", "unknown")
+                    result["success"] = True
+                    return result
+                except Exception as e:
+                    return {
+                        "filename": file_info.get("filename", "unknown"),
+                        "success": False,
+                        "error": str(e)
+                    }
+        
+        return await asyncio.gather(*[_process_one(f) for f in files])
     
     # ==================== DOCUMENT ANALYSIS ====================
     
@@ -319,18 +420,25 @@ class TikaService:
         """Comprehensive document analysis."""
         # Extract all content and metadata
         extraction = await self.extract_all(content, content_type)
+        metadata = extraction.get("metadata", {})
         
-        # Detect language
-        try:
-            language = await self.detect_language(content, content_type)
-        except:
-            language = "unknown"
+        # Take language from the extraction when Tika reported it
+        language = (
+            metadata.get("language")
+            or metadata.get("dc:language")
+            or metadata.get("Content-Language")
+            or extraction.get("tika_metadata", {}).get("X-TIKA:language")
+        )
+        if isinstance(language, list):
+            language = language[0] if language else None
+        if not language:
+            try:
+                language = await self.detect_language(content, content_type)
+            except:
+                language = "unknown"
         
-        # Detect actual content type
-        try:
-            detected_type = await self.detect_content_type(content)
-        except:
-            detected_type = content_type or "unknown"
+        # Detected content type comes back with the extraction
+        detected_type = extraction.get("content_type") or content_type or "unknown"
         
         # Calculate statistics
         text_content = extraction.get("content", "")
@@ -339,7 +447,7 @@ class TikaService:
         
         return {
             "content": text_content,
-            "metadata": extraction.get("metadata", {}),
+            "metadata": metadata,
             "detected_content_type": detected_type.strip(),
             "language": language.strip(),
             "statistics": {
@@ -360,7 +468,7 @@ class TikaService:
         ) as resp:
             if resp.status != 200:
                 return list(self.SUPPORTED_TYPES.values())
-            return await resp.json()
+            return orjson.loads(await resp.read())
     
     async def get_parsers(self) -> Dict[str, Any]:
         """Get available parsers."""
@@ -370,12 +478,14 @@ class TikaService:
         ) as resp:
             if resp.status != 200:
                 return {}
-            return await resp.json()
+            return orjson.loads(await resp.read())
     
     async def get_stats(self) -> Dict[str, Any]:
         """Get Tika server statistics."""
         return {
             "server_url": self.server_url,
             "supported_extensions": list(self.SUPPORTED_TYPES.keys()),
+            "extract_cache_size": len(self._extract_cache),
+            "extract_cache_hits": self.extract_cache_hits,
             "supported_mime_types": await self.get_supported_types()
         }
@@ -38,6 +38,7 @@ class Settings(BaseSettings):
     # RAG Storage
     CHROMA_PERSIST_DIR: str = "./chroma_db"
     EMBEDDING_MODEL: str = "all-MiniLM-L6-v2"
+    EMBEDDING_PRECISION: str = "auto"  # auto, fp32, fp16 (CUDA) or int8 (CPU)
     
     # Simulated drone coordinates (San Francisco area)
     DEFAULT_LAT: float = 37.7749
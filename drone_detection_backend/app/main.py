@@ -2,19 +2,22 @@
 
 import asyncio
 import json
+import time
 import uuid
 from datetime import datetime
 from typing import Dict, List, Optional, Any
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, suppress
+from functools import lru_cache
 
+import orjson
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, UploadFile, File, Form
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse, StreamingResponse
 from pydantic import BaseModel
 
 from .config import settings
 from .models import (
-    StreamConfig, Detection, MapMarker, RAGQuery, RAGResponse,
+    StreamConfig, Detection, RAGQuery, RAGResponse,
     DetectionEvent, SystemStatus, CrossScreenTrack
 )
 from .yolo_detector import DroneDetector
@@ -33,9 +36,27 @@ cross_analyzer: Optional[CrossScreenAnalyzer] = None
 # WebSocket connections
 active_connections: Dict[str, WebSocket] = {}
 
-# Detection event buffer for RAG
-detection_buffer: List[DetectionEvent] = []
-BUFFER_FLUSH_SIZE = 10
+# Detection events waiting to be embedded into RAG
+RAG_QUEUE_MAX = 10_000
+RAG_BATCH_MAX = 128
+RAG_BATCH_WAIT = 0.5
+# Events dropped because ingest could not keep up
+rag_dropped = 0
+# A None item tells rag_ingest_worker to store what it has and exit
+rag_queue: "asyncio.Queue[Optional[DetectionEvent]]" = asyncio.Queue(maxsize=RAG_QUEUE_MAX)
+
+# Concurrent chat requests (RAG lookup + Mistral call) allowed at once
+CHAT_CONCURRENCY = 8
+chat_semaphore = asyncio.Semaphore(CHAT_CONCURRENCY)
+
+# Minimum seconds between broadcasts (10 FPS)
+BROADCAST_INTERVAL = 0.1
+
+# Clients that take longer than this to accept an update are dropped
+BROADCAST_SEND_TIMEOUT = 0.5
+
+# Chunk size for streaming video uploads to disk
+UPLOAD_CHUNK_SIZE = 1 << 20
 
 
 @asynccontextmanager
@@ -50,6 +71,7 @@ async def lifespan(app: FastAPI):
     processor = MultiStreamProcessor(detector)
     rag_engine = RAGEngine()
     mistral_agent = MistralAgent()
+    await mistral_agent.connect()
     cross_analyzer = CrossScreenAnalyzer(mistral_agent)
     
     # Initialize simulated streams
@@ -58,6 +80,7 @@ async def lifespan(app: FastAPI):
     # Start processing task
     processing_task = asyncio.create_task(processor.process_streams())
     broadcast_task = asyncio.create_task(broadcast_detections())
+    rag_task = asyncio.create_task(rag_ingest_worker())
     
     print("System initialized successfully")
     
@@ -68,13 +91,18 @@ async def lifespan(app: FastAPI):
     processor.stop()
     processing_task.cancel()
     broadcast_task.cancel()
+    # Let the RAG worker drain everything already queued before exiting
+    await rag_queue.put(None)
+    await rag_task
+    await mistral_agent.disconnect()
 
 
 app = FastAPI(
     title="Drone Detection API",
     description="YOLO-based drone detection with cross-screen tracking and RAG query",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # CORS middleware
@@ -87,83 +115,133 @@ app.add_middleware(
 )
 
 
+@lru_cache(maxsize=1)
+def iso_timestamp(epoch_second: int) -> str:
+    """ISO-format a UTC second; repeated calls within the same second are free."""
+    return datetime.utcfromtimestamp(epoch_second).isoformat()
+
+
+async def rag_ingest_worker():
+    """Embed queued detection events into RAG in batches, off the event loop.
+    
+    Returns on a None item, after storing every event queued before it.
+    """
+    stopping = False
+    while not stopping:
+        event = await rag_queue.get()
+        if event is None:
+            break
+        batch = [event]
+        
+        # Collect more events until the batch is full or the wait runs out
+        deadline = time.monotonic() + RAG_BATCH_WAIT
+        while len(batch) < RAG_BATCH_MAX:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                event = await asyncio.wait_for(rag_queue.get(), remaining)
+            except asyncio.TimeoutError:
+                break
+            if event is None:
+                stopping = True
+                break
+            batch.append(event)
+        
+        try:
+            await asyncio.to_thread(rag_engine.add_events_batch, batch)
+        except Exception as e:
+            print(f"RAG ingest error: {e}")
+
+
+async def enqueue_rag_events(events: List[DetectionEvent], deadline: float):
+    """Queue events for RAG ingest, waiting on a full queue until `deadline`.
+    
+    Waiting slows the broadcast loop down to the ingest worker's pace; events
+    that still do not fit by the deadline are dropped and counted.
+    """
+    global rag_dropped
+    for i, event in enumerate(events):
+        try:
+            rag_queue.put_nowait(event)
+            continue
+        except asyncio.QueueFull:
+            pass
+        try:
+            await asyncio.wait_for(rag_queue.put(event), max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            rag_dropped += len(events) - i
+            return
+
+
+async def close_client(ws: WebSocket):
+    """Close a dropped client's socket, ignoring errors from dead connections."""
+    with suppress(Exception):
+        await asyncio.wait_for(ws.close(), BROADCAST_SEND_TIMEOUT)
+
+
 async def broadcast_detections():
     """Broadcast detection updates to all connected WebSocket clients."""
-    global detection_buffer
-    
     while True:
-        await asyncio.sleep(0.1)  # 10 FPS update rate
+        if not processor:
+            await asyncio.sleep(BROADCAST_INTERVAL)
+            continue
+        
+        # Sleep until the processor has new results
+        await processor.update_event.wait()
+        processor.update_event.clear()
+        tick_start = time.monotonic()
         
-        if not processor or not active_connections:
+        if not active_connections:
             continue
         
         # Gather all current data
-        frames_data = {}
+        frame_messages = []
         all_detections = []
+        detection_dumps = []
         map_markers = []
         
         for stream_id in range(6):
-            frame_b64 = processor.get_frame_base64(stream_id)
-            if frame_b64:
-                frames_data[stream_id] = frame_b64
-            
-            detections = processor.latest_detections.get(stream_id, [])
-            all_detections.extend(detections)
+            jpeg = processor.get_frame_jpeg(stream_id)
+            if jpeg:
+                # Binary frame: one stream-id byte followed by the raw JPEG
+                frame_messages.append(bytes((stream_id,)) + jpeg)
             
-            # Create map markers
-            for det in detections:
-                if det.latitude and det.longitude:
-                    marker = MapMarker(
-                        id=det.id,
-                        latitude=det.latitude,
-                        longitude=det.longitude,
-                        label=f"{det.bounding_box.class_name} (ID: {det.bounding_box.track_id})",
-                        detection_class=det.bounding_box.class_name,
-                        confidence=det.bounding_box.confidence,
-                        track_id=det.bounding_box.track_id,
-                        timestamp=det.timestamp,
-                        metadata={
-                            "stream_id": det.stream_id,
-                            "velocity": det.velocity,
-                            "predicted_next_screen": det.predicted_next_screen
-                        }
-                    )
-                    map_markers.append(marker)
+            all_detections.extend(processor.latest_detections.get(stream_id, []))
+            detection_dumps.extend(processor.latest_dumps.get(stream_id, []))
+            map_markers.extend(processor.latest_markers.get(stream_id, []))
         
         # Get cross-screen tracks
         cross_tracks = detector.get_cross_screen_tracks() if detector else []
         
         # Store detections for RAG
-        for det in all_detections:
-            event = DetectionEvent(
-                id=det.id,
-                timestamp=det.timestamp,
-                stream_id=det.stream_id,
-                detection_class=det.bounding_box.class_name,
-                confidence=det.bounding_box.confidence,
-                latitude=det.latitude,
-                longitude=det.longitude,
-                description=f"Detected {det.bounding_box.class_name} on stream {det.stream_id}",
-                raw_metadata={
-                    "track_id": det.bounding_box.track_id,
-                    "velocity": det.velocity,
-                    "predicted_next_screen": det.predicted_next_screen
-                }
-            )
-            detection_buffer.append(event)
-        
-        # Flush buffer to RAG
-        if len(detection_buffer) >= BUFFER_FLUSH_SIZE and rag_engine:
-            rag_engine.add_events_batch(detection_buffer[:BUFFER_FLUSH_SIZE])
-            detection_buffer = detection_buffer[BUFFER_FLUSH_SIZE:]
+        if rag_engine:
+            events = []
+            for det in all_detections:
+                events.append(DetectionEvent.from_trusted(
+                    id=det.id,
+                    timestamp=det.timestamp,
+                    stream_id=det.stream_id,
+                    detection_class=det.bounding_box.class_name,
+                    confidence=det.bounding_box.confidence,
+                    latitude=det.latitude,
+                    longitude=det.longitude,
+                    description=f"Detected {det.bounding_box.class_name} on stream {det.stream_id}",
+                    raw_metadata={
+                        "track_id": det.bounding_box.track_id,
+                        "velocity": det.velocity,
+                        "predicted_next_screen": det.predicted_next_screen
+                    }
+                ))
+            await enqueue_rag_events(events, tick_start + BROADCAST_INTERVAL)
         
         # Prepare broadcast message
         message = {
             "type": "detection_update",
-            "timestamp": datetime.utcnow().isoformat(),
-            "frames": frames_data,
-            "detections": [det.model_dump() for det in all_detections],
-            "map_markers": [m.model_dump() for m in map_markers],
+            "timestamp": iso_timestamp(int(time.time())),
+            "frame_ids": [frame[0] for frame in frame_messages],
+            "detections": detection_dumps,
+            "map_markers": map_markers,
             "cross_tracks": [
                 {
                     "track_id": t.track_id,
@@ -176,17 +254,34 @@ async def broadcast_detections():
             ]
         }
         
+        # Serialize once for all clients; orjson handles the datetimes in the dumps
+        payload = orjson.dumps(message).decode()
+        
+        # Metadata goes out as JSON text, then each frame as a binary message
+        async def send_update(ws: WebSocket):
+            await ws.send_text(payload)
+            for frame in frame_messages:
+                await ws.send_bytes(frame)
+        
         # Broadcast to all clients
-        disconnected = []
-        for client_id, ws in active_connections.items():
-            try:
-                await ws.send_json(message)
-            except Exception:
-                disconnected.append(client_id)
+        clients = list(active_connections.items())
+        results = await asyncio.gather(
+            *(asyncio.wait_for(send_update(ws), BROADCAST_SEND_TIMEOUT) for _, ws in clients),
+            return_exceptions=True
+        )
         
-        # Remove disconnected clients
-        for client_id in disconnected:
-            del active_connections[client_id]
+        # Remove and close disconnected and stalled clients; a send cancelled
+        # by the timeout may have left a partial frame, so the socket is not
+        # reusable and closing it lets the frontend reconnect cleanly
+        dropped = [
+            ws for (client_id, ws), result in zip(clients, results)
+            if isinstance(result, Exception) and active_connections.pop(client_id, None)
+        ]
+        if dropped:
+            await asyncio.gather(*(close_client(ws) for ws in dropped))
+        
+        # Coalesce bursts to at most 10 updates per second
+        await asyncio.sleep(max(0.0, BROADCAST_INTERVAL - (time.monotonic() - tick_start)))
 
 
 # REST API Endpoints
@@ -275,7 +370,7 @@ async def get_tracks():
             "velocity": t.velocity_vector,
             "screens_crossed": t.total_screens_crossed,
             "last_seen": t.last_seen.isoformat(),
-            "detection_count": len(t.detections)
+            "detection_count": t.detection_count
         }
         for t in tracks
     ]
@@ -306,6 +401,31 @@ async def get_map_markers():
 
 # RAG and Chat Endpoints
 
+async def answer_chat(message: str, include_history: bool = True) -> RAGResponse:
+    """Answer a chat message from the semantic cache or via RAG + Mistral.
+    
+    The cache key ignores conversation history, so only history-free
+    answers are cached or served from it.
+    """
+    async with chat_semaphore:
+        # Get relevant context from RAG; embedding and search run off the event loop
+        context, context_hash = await asyncio.to_thread(rag_engine.get_context_for_query, message)
+        
+        if not include_history:
+            cached = rag_engine.cached_response(message, context_hash)
+            if cached:
+                mistral_agent.record_exchange(message, cached.answer)
+                return cached
+        
+        # Query Mistral
+        response = await mistral_agent.query(message, context, include_history=include_history)
+        
+        # Failed calls report zero confidence; only cache real answers
+        if response.confidence > 0 and not include_history:
+            rag_engine.cache_response(message, context_hash, response)
+        return response
+
+
 class ChatRequest(BaseModel):
     message: str
     include_history: bool = True
@@ -317,15 +437,7 @@ async def chat(request: ChatRequest):
     if not rag_engine or not mistral_agent:
         raise HTTPException(status_code=500, detail="RAG or Mistral not initialized")
     
-    # Get relevant context from RAG
-    context = rag_engine.get_context_for_query(request.message)
-    
-    # Query Mistral
-    response = await mistral_agent.query(
-        request.message,
-        context,
-        include_history=request.include_history
-    )
+    response = await answer_chat(request.message, include_history=request.include_history)
     
     return {
         "answer": response.answer,
@@ -334,6 +446,53 @@ async def chat(request: ChatRequest):
     }
 
 
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """Chat with the AI agent, streaming the answer as server-sent events.
+    
+    Each event carries a JSON object with a "delta" text fragment (or an
+    "error"); the stream ends with a "[DONE]" event.
+    """
+    if not rag_engine or not mistral_agent:
+        raise HTTPException(status_code=500, detail="RAG or Mistral not initialized")
+    
+    async def events():
+        async with chat_semaphore:
+            context, context_hash = await asyncio.to_thread(rag_engine.get_context_for_query, request.message)
+            
+            # Only history-free answers are cached, as in answer_chat
+            cached = None
+            if not request.include_history:
+                cached = rag_engine.cached_response(request.message, context_hash)
+            if cached:
+                mistral_agent.record_exchange(request.message, cached.answer)
+                yield b"data: " + orjson.dumps({"delta": cached.answer}) + b"\n\n"
+            else:
+                parts = []
+                try:
+                    async for delta in mistral_agent.query_stream(
+                        request.message, context, include_history=request.include_history
+                    ):
+                        parts.append(delta)
+                        yield b"data: " + orjson.dumps({"delta": delta}) + b"\n\n"
+                except Exception as e:
+                    yield b"data: " + orjson.dumps({"error": str(e)}) + b"\n\n"
+                else:
+                    if not request.include_history:
+                        rag_engine.cache_response(
+                            request.message,
+                            context_hash,
+                            mistral_agent.build_response("".join(parts), context)
+                        )
+        yield b"data: [DONE]\n\n"
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"}
+    )
+
+
 @app.get("/chat/history")
 async def get_chat_history():
     """Get chat history."""
@@ -357,7 +516,7 @@ async def get_rag_stats():
     if not rag_engine:
         return {}
     
-    return rag_engine.get_stats()
+    return {**rag_engine.get_stats(), "ingest_dropped": rag_dropped}
 
 
 @app.get("/rag/recent")
@@ -381,7 +540,7 @@ async def update_mistral_settings(settings_data: MistralSettings):
     if not mistral_agent:
         raise HTTPException(status_code=500, detail="Mistral agent not initialized")
     
-    mistral_agent.set_api_key(settings_data.api_key)
+    await mistral_agent.set_api_key(settings_data.api_key)
     
     return {
         "message": "API key updated",
@@ -426,11 +585,7 @@ async def websocket_endpoint(websocket: WebSocket):
                 elif data.get("type") == "chat":
                     # Handle chat through WebSocket
                     if rag_engine and mistral_agent:
-                        context = rag_engine.get_context_for_query(data.get("message", ""))
-                        response = await mistral_agent.query(
-                            data.get("message", ""),
-                            context
-                        )
+                        response = await answer_chat(data.get("message", ""))
                         await websocket.send_json({
                             "type": "chat_response",
                             "answer": response.answer,
@@ -462,12 +617,16 @@ async def upload_video(
     # Save uploaded file
     import tempfile
     import os
+    import aiofiles
     
     suffix = os.path.splitext(file.filename)[1] if file.filename else ".mp4"
-    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-        content = await file.read()
-        tmp.write(content)
-        tmp_path = tmp.name
+    fd, tmp_path = tempfile.mkstemp(suffix=suffix)
+    os.close(fd)
+    
+    # Stream to disk in chunks so large videos are never held in memory
+    async with aiofiles.open(tmp_path, 'wb') as out:
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            await out.write(chunk)
     
     # Create stream config
     config = StreamConfig(
@@ -492,4 +651,11 @@ async def upload_video(
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host=settings.HOST, port=settings.PORT)
+    uvicorn.run(
+        app,
+        host=settings.HOST,
+        port=settings.PORT,
+        loop="uvloop",
+        http="httptools",
+        ws="websockets"
+    )
@@ -1,12 +1,29 @@
 """Mistral AI agent for RAG-based query answering."""
 
+import asyncio
+import math
+import time
 import httpx
-from typing import Optional, List, Dict, Any
+import orjson
+from collections import deque
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Deque, Optional, List, Dict, Any
 from datetime import datetime
-import json
 
 from .config import settings
-from .models import ChatMessage, RAGResponse
+from .models import RAGResponse
+
+
+class MistralAPIError(Exception):
+    """Mistral API rejected a request or is not configured."""
+
+
+@dataclass(slots=True)
+class _HistoryEntry:
+    """Conversation history entry; internal only, never validated."""
+    role: str  # "user" or "assistant"
+    content: str
+    timestamp: datetime = field(default_factory=datetime.utcnow)
 
 
 class MistralAgent:
@@ -31,119 +48,223 @@ When answering:
 
 If you don't have enough information to answer a question, say so clearly."""
 
+    CONTEXT_HEADER = "Context from detection database:\n"
+    CONTEXT_FOOTER = "Please answer based on the provided context. If the context doesn't contain relevant information, say so."
+    
+    # Messages kept in history (and sent with each query)
+    HISTORY_SIZE = 10
+    
+    # Concurrent requests allowed to the Mistral API
+    MAX_CONCURRENCY = 8
+    
+    # Seconds a connection check result stays valid
+    CONNECTION_CHECK_TTL = 300.0
+    
+    # Estimated confidence reported for a completed answer
+    ANSWER_CONFIDENCE = 0.85
+
     def __init__(self, api_key: Optional[str] = None):
         self.api_key = api_key or settings.MISTRAL_API_KEY
         self.model = settings.MISTRAL_MODEL
         self.base_url = "https://api.mistral.ai/v1"
-        self.conversation_history: List[ChatMessage] = []
+        self.conversation_history: Deque[_HistoryEntry] = deque(maxlen=self.HISTORY_SIZE)
         self._connected = False
+        self._client: Optional[httpx.AsyncClient] = None
+        self._sem = asyncio.Semaphore(self.MAX_CONCURRENCY)
+        self._last_check = float("-inf")  # Never checked; monotonic() starts near boot
+        self._check_task: Optional[asyncio.Task] = None
+    
+    async def connect(self):
+        """Open the shared HTTP client.
         
-        if self.api_key:
-            self._test_connection()
+        The API key is checked lazily by is_connected, so startup does not
+        wait on a round-trip to the API.
+        """
+        self._get_client()
     
-    def _test_connection(self):
+    async def disconnect(self):
+        """Close the shared HTTP client."""
+        if self._client:
+            await self._client.aclose()
+            self._client = None
+    
+    def _get_client(self) -> httpx.AsyncClient:
+        """Get the shared client, creating it on first use.
+        
+        One long-lived HTTP/2 client keeps the TLS session to the API warm
+        instead of handshaking on every query.
+        """
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                http2=True,
+                limits=httpx.Limits(max_keepalive_connections=20, max_connections=100),
+                timeout=httpx.Timeout(30.0, connect=5.0)
+            )
+        return self._client
+    
+    async def _test_connection(self):
         """Test connection to Mistral API."""
+        self._last_check = time.monotonic()
         try:
-            with httpx.Client() as client:
-                response = client.get(
-                    f"{self.base_url}/models",
-                    headers={"Authorization": f"Bearer {self.api_key}"},
-                    timeout=10.0
-                )
-                self._connected = response.status_code == 200
+            response = await self._get_client().get(
+                "/models",
+                headers={"Authorization": f"Bearer {self.api_key}"},
+                timeout=10.0
+            )
+            self._connected = response.status_code == 200
         except Exception:
             self._connected = False
     
-    def set_api_key(self, api_key: str):
+    async def set_api_key(self, api_key: str):
         """Set or update the API key."""
         self.api_key = api_key
-        self._test_connection()
+        await self._test_connection()
     
     @property
     def is_connected(self) -> bool:
-        """Check if connected to Mistral API."""
+        """Check if connected to Mistral API.
+        
+        Returns the cached result and, once it is older than
+        CONNECTION_CHECK_TTL, schedules a refresh in the background.
+        """
+        if self.api_key and time.monotonic() - self._last_check > self.CONNECTION_CHECK_TTL:
+            self._schedule_check()
         return self._connected and self.api_key is not None
     
-    async def query(
+    def _schedule_check(self):
+        """Start a background connection test unless one is running."""
+        if self._check_task and not self._check_task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._check_task = loop.create_task(self._test_connection())
+    
+    def _build_messages(
         self,
         user_query: str,
         context: str,
-        include_history: bool = True
-    ) -> RAGResponse:
-        """Query the Mistral agent with RAG context."""
-        if not self.api_key:
-            return RAGResponse(
-                answer="Mistral API key not configured. Please add your API key in settings.",
-                sources=[],
-                confidence=0.0
-            )
-        
-        # Build messages
+        include_history: bool
+    ) -> List[Dict[str, str]]:
+        """Build the chat messages for a query."""
+        # Stable system prompt and context first, so repeat calls share a
+        # byte-identical prefix the provider can cache
         messages = [
-            {"role": "system", "content": self.SYSTEM_PROMPT}
+            {"role": "system", "content": self.SYSTEM_PROMPT},
+            {"role": "system", "content": f"{self.CONTEXT_HEADER}{context}\n\n{self.CONTEXT_FOOTER}"}
         ]
         
         # Add conversation history if requested
         if include_history:
-            for msg in self.conversation_history[-10:]:  # Last 10 messages
+            for msg in self.conversation_history:
                 messages.append({
                     "role": msg.role,
                     "content": msg.content
                 })
         
-        # Add context and user query
-        augmented_query = f"""Context from detection database:
-{context}
-
-User question: {user_query}
-
-Please answer based on the provided context. If the context doesn't contain relevant information, say so."""
+        # Only the user question varies per call
+        messages.append({"role": "user", "content": user_query})
+        return messages
+    
+    async def query_stream(
+        self,
+        user_query: str,
+        context: str,
+        include_history: bool = True
+    ) -> AsyncIterator[str]:
+        """Stream answer text from the Mistral agent as it is generated.
         
-        messages.append({"role": "user", "content": augmented_query})
+        Yields content deltas from the SSE completion stream; the full
+        answer is added to history once the stream ends. Raises
+        MistralAPIError for a missing key or a non-200 response.
+        """
+        if not self.api_key:
+            raise MistralAPIError("Mistral API key not configured. Please add your API key in settings.")
         
-        try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.base_url}/chat/completions",
-                    headers={
-                        "Authorization": f"Bearer {self.api_key}",
-                        "Content-Type": "application/json"
-                    },
-                    json={
-                        "model": self.model,
-                        "messages": messages,
-                        "temperature": 0.7,
-                        "max_tokens": 1000
-                    },
-                    timeout=30.0
-                )
-                
+        messages = self._build_messages(user_query, context, include_history)
+        parts = []
+        
+        async with self._sem:
+            async with self._get_client().stream(
+                "POST",
+                "/chat/completions",
+                headers={
+                    "Authorization": f"Bearer {self.api_key}",
+                    "Content-Type": "application/json",
+                    "Accept": "text/event-stream"
+                },
+                content=orjson.dumps({
+                    "model": self.model,
+                    "messages": messages,
+                    "temperature": 0.7,
+                    "max_tokens": 1000,
+                    "stream": True
+                })
+            ) as response:
                 if response.status_code != 200:
-                    return RAGResponse(
-                        answer=f"API error: {response.status_code} - {response.text}",
-                        sources=[],
-                        confidence=0.0
+                    body = await response.aread()
+                    raise MistralAPIError(
+                        f"API error: {response.status_code} - {body.decode(errors='replace')}"
                     )
                 
-                data = response.json()
-                answer = data["choices"][0]["message"]["content"]
-                
-                # Store in history
-                self.conversation_history.append(ChatMessage(
-                    role="user",
-                    content=user_query
-                ))
-                self.conversation_history.append(ChatMessage(
-                    role="assistant",
-                    content=answer
-                ))
-                
-                return RAGResponse(
-                    answer=answer,
-                    sources=[{"context": context}],
-                    confidence=0.85  # Estimated confidence
-                )
-                
+                async for line in response.aiter_lines():
+                    if not line.startswith("data: "):
+                        continue
+                    data = line[6:]
+                    if data == "[DONE]":
+                        break
+                    delta = orjson.loads(data)["choices"][0]["delta"].get("content")
+                    if delta:
+                        parts.append(delta)
+                        yield delta
+        
+        # A successful completion doubles as a connection check
+        self._connected = True
+        self._last_check = time.monotonic()
+        
+        self.record_exchange(user_query, "".join(parts))
+    
+    def build_response(self, answer: str, context: str) -> RAGResponse:
+        """Wrap a completed answer and its RAG context in a RAGResponse."""
+        return RAGResponse(
+            answer=answer,
+            sources=[{"context": context}],
+            confidence=self.ANSWER_CONFIDENCE
+        )
+    
+    def record_exchange(self, user_query: str, answer: str):
+        """Append a question and its answer to the conversation history."""
+        self.conversation_history.append(_HistoryEntry(
+            role="user",
+            content=user_query
+        ))
+        self.conversation_history.append(_HistoryEntry(
+            role="assistant",
+            content=answer
+        ))
+    
+    async def query(
+        self,
+        user_query: str,
+        context: str,
+        include_history: bool = True
+    ) -> RAGResponse:
+        """Query the Mistral agent with RAG context."""
+        try:
+            answer = "".join([
+                delta async for delta in self.query_stream(user_query, context, include_history)
+            ])
+            
+            return self.build_response(answer, context)
+            
+        except MistralAPIError as e:
+            return RAGResponse(
+                answer=str(e),
+                sources=[],
+                confidence=0.0
+            )
         except httpx.TimeoutException:
             return RAGResponse(
                 answer="Request timed out. Please try again.",
@@ -159,7 +280,7 @@ Please answer based on the provided context. If the context doesn't contain rele
     
     def clear_history(self):
         """Clear conversation history."""
-        self.conversation_history = []
+        self.conversation_history.clear()
     
     def get_history(self) -> List[Dict[str, Any]]:
         """Get conversation history."""
@@ -217,14 +338,16 @@ Recent Detection History:
         velocity = track_data.get("velocity_vector", {})
         vx = velocity.get("vx", 0)
         vy = velocity.get("vy", 0)
+        ax, ay = abs(vx), abs(vy)
         
-        # Determine movement direction
-        direction = "stationary"
-        if abs(vx) > 5 or abs(vy) > 5:
-            if abs(vx) > abs(vy):
-                direction = "right" if vx > 0 else "left"
-            else:
-                direction = "down" if vy > 0 else "up"
+        # Determine movement direction from the dominant axis and its sign
+        dominant_x = ax > ay
+        if ax <= 5 and ay <= 5:
+            direction = "stationary"
+        elif dominant_x:
+            direction = "right" if vx > 0 else "left"
+        else:
+            direction = "down" if vy > 0 else "up"
         
         # Estimate behavior
         screens_crossed = track_data.get("total_screens_crossed", 0)
@@ -237,6 +360,6 @@ Recent Detection History:
         return {
             "direction": direction,
             "behavior": behavior,
-            "speed": (vx**2 + vy**2)**0.5,
+            "speed": math.hypot(vx, vy),
             "predicted_screens": track_data.get("predicted_screens", [])
         }
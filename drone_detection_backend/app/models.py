@@ -39,6 +39,15 @@ class Detection(BaseModel):
     velocity: Optional[Dict[str, float]] = None
     predicted_next_screen: Optional[int] = None
     metadata: Dict[str, Any] = Field(default_factory=dict)
+    
+    @classmethod
+    def from_trusted(cls, **data) -> "Detection":
+        """Build from already-typed values without running validation.
+        
+        For internal hot paths only; API input must go through the
+        normal constructor.
+        """
+        return cls.model_construct(**data)
 
 
 class StreamConfig(BaseModel):
@@ -59,6 +68,7 @@ class CrossScreenTrack(BaseModel):
     velocity_vector: Dict[str, float]
     last_seen: datetime
     total_screens_crossed: int = 0
+    detection_count: int = 0  # all updates, not just the retained detections
 
 
 class MapMarker(BaseModel):
@@ -105,6 +115,11 @@ class DetectionEvent(BaseModel):
     longitude: Optional[float]
     description: str
     raw_metadata: Dict[str, Any]
+    
+    @classmethod
+    def from_trusted(cls, **data) -> "DetectionEvent":
+        """Build from already-typed values without running validation."""
+        return cls.model_construct(**data)
 
 
 class SystemStatus(BaseModel):
@@ -1,10 +1,18 @@
 """RAG engine for detection event storage and querying."""
 
 import chromadb
+import numpy as np
+import torch
 from sentence_transformers import SentenceTransformer
-from typing import List, Dict, Any, Optional
+from typing import Deque, List, Dict, Any, Optional, Tuple
 from datetime import datetime
+from functools import lru_cache
+from collections import deque
+from itertools import islice
+import hashlib
 import json
+import threading
+import time
 import uuid
 import os
 
@@ -12,11 +20,78 @@ from .config import settings
 from .models import DetectionEvent, RAGQuery, RAGResponse
 
 
+class SemanticCache:
+    """Recent chat answers, matched to new queries by embedding similarity.
+    
+    Embeddings live in a fixed-size ring buffer. A hit also requires the
+    same context hash, so answers are reused only while the retrieved
+    detections are unchanged; entries older than `ttl` are ignored.
+    """
+    
+    def __init__(
+        self,
+        dim: int,
+        capacity: int = 512,
+        threshold: float = 0.93,
+        ttl: float = 60.0
+    ):
+        self.capacity = capacity
+        self.threshold = threshold
+        self.ttl = ttl
+        self.embeddings = np.zeros((capacity, dim), dtype=np.float32)
+        self.created = np.full(capacity, -np.inf)
+        self.context_hashes = np.full(capacity, "", dtype="U32")
+        self.responses: List[Optional[RAGResponse]] = [None] * capacity
+        self._next = 0
+        self.hits = 0
+    
+    def lookup(self, embedding: np.ndarray, context_hash: str) -> Optional[RAGResponse]:
+        """Return the cached answer for the most similar live query, if close enough."""
+        sims = self.embeddings @ embedding
+        sims[time.monotonic() - self.created > self.ttl] = -1.0
+        sims[self.context_hashes != context_hash] = -1.0
+        best = int(np.argmax(sims))
+        if sims[best] >= self.threshold:
+            self.hits += 1
+            return self.responses[best]
+        return None
+    
+    def store(self, embedding: np.ndarray, context_hash: str, response: RAGResponse):
+        """Cache an answer, overwriting the oldest entry when full."""
+        i = self._next
+        self.embeddings[i] = embedding
+        self.context_hashes[i] = context_hash
+        self.created[i] = time.monotonic()
+        self.responses[i] = response
+        self._next = (i + 1) % self.capacity
+
+
 class RAGEngine:
     """RAG engine for storing and querying detection events."""
     
+    # Documents per encoder forward pass
+    ENCODE_BATCH_SIZE = 64
+    
+    # Distinct query strings whose embeddings are kept
+    QUERY_CACHE_SIZE = 1024
+    
+    # Most recent event ids tracked for get_recent_events
+    RECENT_IDS_SIZE = 1000
+    
+    # Embeddings are unit-normalized, so inner product ranks like cosine
+    # without the per-comparison norm. Denser graph and wider build/search
+    # beams keep recall up as the collection grows past ~100k events.
+    COLLECTION_METADATA = {
+        "hnsw:space": "ip",
+        "hnsw:construction_ef": 200,
+        "hnsw:M": 32,
+        "hnsw:search_ef": 64,
+    }
+    
     def __init__(self):
-        self.embedding_model = SentenceTransformer(settings.EMBEDDING_MODEL)
+        self.embedding_model = self._load_embedding_model()
+        self._encode_query = lru_cache(maxsize=self.QUERY_CACHE_SIZE)(self._encode_query_uncached)
+        self.semantic_cache = SemanticCache(self.embedding_model.get_sentence_embedding_dimension())
         
         # Initialize ChromaDB with persistent storage
         persist_dir = settings.CHROMA_PERSIST_DIR
@@ -27,53 +102,81 @@ class RAGEngine:
         # Create or get collection
         self.collection = self.chroma_client.get_or_create_collection(
             name="detection_events",
-            metadata={"hnsw:space": "cosine"}
+            metadata=self.COLLECTION_METADATA
         )
         
         self.event_count = 0
+        
+        # Newest last; seeded from the persisted collection once at startup
+        self._recent_ids: Deque[str] = deque(maxlen=self.RECENT_IDS_SIZE)
+        self._seed_recent_ids()
+        
+        # Writes may come from worker threads; serialize store + bookkeeping
+        self._write_lock = threading.Lock()
+    
+    def _load_embedding_model(self) -> SentenceTransformer:
+        """Load the embedding model at the configured precision.
+        
+        fp16 halves weights and matmul work on CUDA; int8 applies dynamic
+        quantization to the Linear layers for faster CPU inference.
+        """
+        model = SentenceTransformer(settings.EMBEDDING_MODEL)
+        precision = settings.EMBEDDING_PRECISION
+        if precision == "auto":
+            precision = "fp16" if torch.cuda.is_available() else "int8"
+        elif precision == "fp16" and not torch.cuda.is_available():
+            precision = "fp32"
+        
+        if precision == "fp16":
+            model = model.half().to("cuda")
+        elif precision == "int8":
+            model = torch.quantization.quantize_dynamic(
+                model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+        print(f"Embedding model loaded: {settings.EMBEDDING_MODEL} ({precision})")
+        return model
+    
+    def _seed_recent_ids(self):
+        """Load the newest persisted event ids into the recent-id window."""
+        if self.collection.count() == 0:
+            return
+        results = self.collection.get(include=["metadatas"])
+        metadatas = results["metadatas"] or [{}] * len(results["ids"])
+        ordered = sorted(
+            zip(results["ids"], metadatas),
+            key=lambda pair: pair[1].get("timestamp", "")
+        )
+        self._recent_ids.extend(event_id for event_id, _ in ordered[-self.RECENT_IDS_SIZE:])
     
     def _create_document(self, event: DetectionEvent) -> str:
         """Create a searchable document from detection event."""
-        doc_parts = [
+        parts = (
             f"Detection event at {event.timestamp.isoformat()}",
             f"Stream {event.stream_id}",
             f"Detected: {event.detection_class}",
             f"Confidence: {event.confidence:.2%}",
             event.description
-        ]
-        
-        if event.latitude and event.longitude:
-            doc_parts.append(f"Location: {event.latitude:.6f}, {event.longitude:.6f}")
+        )
+        location = (
+            (f"Location: {event.latitude:.6f}, {event.longitude:.6f}",)
+            if event.latitude and event.longitude else ()
+        )
         
         # Add metadata as searchable text
-        for key, value in event.raw_metadata.items():
-            if isinstance(value, (str, int, float)):
-                doc_parts.append(f"{key}: {value}")
+        extra = [
+            f"{key}: {value}" for key, value in event.raw_metadata.items()
+            if isinstance(value, (str, int, float))
+        ]
         
-        return " | ".join(doc_parts)
+        return " | ".join((*parts, *location, *extra))
+    
+    def _encode_query_uncached(self, text: str) -> Tuple[float, ...]:
+        """Embed a query string; wrapped in a per-instance LRU cache."""
+        return tuple(self.embedding_model.encode(text, normalize_embeddings=True).tolist())
     
     def add_event(self, event: DetectionEvent):
         """Add a detection event to the RAG store."""
-        document = self._create_document(event)
-        embedding = self.embedding_model.encode(document).tolist()
-        
-        metadata = {
-            "timestamp": event.timestamp.isoformat(),
-            "stream_id": event.stream_id,
-            "detection_class": event.detection_class,
-            "confidence": event.confidence,
-            "latitude": event.latitude or 0,
-            "longitude": event.longitude or 0,
-        }
-        
-        self.collection.add(
-            ids=[event.id],
-            embeddings=[embedding],
-            documents=[document],
-            metadatas=[metadata]
-        )
-        
-        self.event_count += 1
+        self.add_events_batch([event])
     
     def add_events_batch(self, events: List[DetectionEvent]):
         """Add multiple events in batch."""
@@ -81,17 +184,12 @@ class RAGEngine:
             return
         
         ids = []
-        embeddings = []
         documents = []
         metadatas = []
         
         for event in events:
-            document = self._create_document(event)
-            embedding = self.embedding_model.encode(document).tolist()
-            
             ids.append(event.id)
-            embeddings.append(embedding)
-            documents.append(document)
+            documents.append(self._create_document(event))
             metadatas.append({
                 "timestamp": event.timestamp.isoformat(),
                 "stream_id": event.stream_id,
@@ -101,18 +199,29 @@ class RAGEngine:
                 "longitude": event.longitude or 0,
             })
         
-        self.collection.add(
-            ids=ids,
-            embeddings=embeddings,
-            documents=documents,
-            metadatas=metadatas
-        )
+        # One batched forward pass for all documents
+        embeddings = self.embedding_model.encode(
+            documents,
+            batch_size=self.ENCODE_BATCH_SIZE,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False
+        ).tolist()
         
-        self.event_count += len(events)
+        with self._write_lock:
+            self.collection.add(
+                ids=ids,
+                embeddings=embeddings,
+                documents=documents,
+                metadatas=metadatas
+            )
+            
+            self.event_count += len(events)
+            self._recent_ids.extend(ids)
     
     def query(self, query: RAGQuery) -> List[Dict[str, Any]]:
         """Query the RAG store for relevant events."""
-        query_embedding = self.embedding_model.encode(query.query).tolist()
+        query_embedding = list(self._encode_query(query.query))
         
         results = self.collection.query(
             query_embeddings=[query_embedding],
@@ -129,63 +238,86 @@ class RAGEngine:
                     "distance": results["distances"][0][i] if results["distances"] else 0
                 })
         
+        # HNSW order is not stable for near-ties; fix it so the same hits
+        # always produce the same context bytes
+        sources.sort(key=lambda s: (s["distance"], s["metadata"].get("timestamp", "")))
         return sources
     
-    def get_context_for_query(self, query: str, limit: int = 5) -> str:
-        """Get formatted context string for AI query."""
+    def get_context_for_query(self, query: str, limit: int = 5) -> Tuple[str, str]:
+        """Get formatted context string for AI query and its content hash.
+        
+        The hash identifies the exact context bytes, so callers can key
+        caches on it.
+        """
         rag_query = RAGQuery(query=query, context_limit=limit)
         sources = self.query(rag_query)
         
         if not sources:
-            return "No relevant detection events found in the database."
+            context = "No relevant detection events found in the database."
+        else:
+            context = "Relevant detection events:\n" + "\n".join(
+                f"- {source['document']}" for source in sources
+            )
         
-        context_parts = ["Relevant detection events:"]
-        for i, source in enumerate(sources, 1):
-            context_parts.append(f"\n{i}. {source['document']}")
-        
-        return "\n".join(context_parts)
+        return context, hashlib.md5(context.encode()).hexdigest()
+    
+    def cached_response(self, query: str, context_hash: str) -> Optional[RAGResponse]:
+        """Get a cached answer for a similar recent query with the same context."""
+        embedding = np.asarray(self._encode_query(query), dtype=np.float32)
+        return self.semantic_cache.lookup(embedding, context_hash)
+    
+    def cache_response(self, query: str, context_hash: str, response: RAGResponse):
+        """Remember an answer for similar future queries with the same context."""
+        embedding = np.asarray(self._encode_query(query), dtype=np.float32)
+        self.semantic_cache.store(embedding, context_hash, response)
     
     def get_recent_events(self, limit: int = 10) -> List[Dict[str, Any]]:
         """Get most recent events."""
-        # ChromaDB doesn't support sorting, so we get all and sort
+        # Fetch only the newest ids instead of scanning and sorting everything
+        ids = list(islice(reversed(self._recent_ids), limit))
+        if not ids:
+            return []
+        
         results = self.collection.get(
+            ids=ids,
             include=["documents", "metadatas"]
         )
         
+        # ChromaDB does not return ids in request order
+        position = {event_id: i for i, event_id in enumerate(results["ids"])}
         events = []
-        if results["documents"]:
-            for i, doc in enumerate(results["documents"]):
-                events.append({
-                    "id": results["ids"][i],
-                    "document": doc,
-                    "metadata": results["metadatas"][i] if results["metadatas"] else {}
-                })
-        
-        # Sort by timestamp descending
-        events.sort(
-            key=lambda x: x["metadata"].get("timestamp", ""),
-            reverse=True
-        )
+        for event_id in ids:
+            i = position.get(event_id)
+            if i is None:
+                continue
+            events.append({
+                "id": event_id,
+                "document": results["documents"][i],
+                "metadata": results["metadatas"][i] if results["metadatas"] else {}
+            })
         
-        return events[:limit]
+        return events
     
     def get_stats(self) -> Dict[str, Any]:
         """Get RAG store statistics."""
         return {
             "total_documents": self.collection.count(),
+            "semantic_cache_hits": self.semantic_cache.hits,
             "embedding_model": settings.EMBEDDING_MODEL,
             "persist_directory": settings.CHROMA_PERSIST_DIR
         }
     
     def clear(self):
         """Clear all events from the store."""
-        # Delete and recreate collection
-        try:
-            self.chroma_client.delete_collection("detection_events")
-        except Exception:
-            pass
-        self.collection = self.chroma_client.get_or_create_collection(
-            name="detection_events",
-            metadata={"hnsw:space": "cosine"}
-        )
-        self.event_count = 0
+        with self._write_lock:
+            # Delete and recreate collection
+            try:
+                self.chroma_client.delete_collection("detection_events")
+            except Exception:
+                pass
+            self.collection = self.chroma_client.get_or_create_collection(
+                name="detection_events",
+                metadata=self.COLLECTION_METADATA
+            )
+            self.event_count = 0
+            self._recent_ids.clear()
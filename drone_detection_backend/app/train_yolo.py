@@ -1,5 +1,7 @@
 """YOLO model training script for drone detection."""
 
+import math
+import multiprocessing as mp
 import os
 import yaml
 import shutil
@@ -16,10 +18,20 @@ class DroneDatasetGenerator:
     
     CLASSES = ["drone", "bird", "aircraft", "helicopter", "person", "vehicle"]
     
+    JPEG_PARAMS = [cv2.IMWRITE_JPEG_QUALITY, 85, cv2.IMWRITE_JPEG_OPTIMIZE, 1]
+    
+    # Unit (cos, sin) directions of the four drone arms at 45/135/225/315 degrees
+    _ARM_DIRS = np.array([
+        (math.cos(math.radians(a)), math.sin(math.radians(a)))
+        for a in (45, 135, 225, 315)
+    ])
+    
     def __init__(self, output_dir: str = "datasets/drone_detection"):
         self.output_dir = Path(output_dir)
         self.images_dir = self.output_dir / "images"
         self.labels_dir = self.output_dir / "labels"
+        self._noise: Optional[np.ndarray] = None
+        self._scratch: Optional[np.ndarray] = None
         
     def setup_directories(self):
         """Create dataset directory structure."""
@@ -41,10 +53,8 @@ class DroneDatasetGenerator:
         cv2.circle(frame, (x, y), size // 3, (50, 50, 50), -1)
         
         # Arms and rotors
-        for angle in [45, 135, 225, 315]:
-            rad = np.radians(angle)
-            arm_x = int(x + size * 0.6 * np.cos(rad))
-            arm_y = int(y + size * 0.6 * np.sin(rad))
+        arm_ends = (np.array([x, y]) + size * 0.6 * self._ARM_DIRS).astype(np.int32)
+        for arm_x, arm_y in arm_ends.tolist():
             cv2.line(frame, (x, y), (arm_x, arm_y), (80, 80, 80), 2)
             cv2.circle(frame, (arm_x, arm_y), size // 5, (100, 100, 100), -1)
         
@@ -94,16 +104,19 @@ class DroneDatasetGenerator:
         
         return frame, [1, cx, cy, bw, bh]  # bird class
     
-    def generate_sky_background(self, width: int = 640, height: int = 480) -> np.ndarray:
-        """Generate a sky-like background."""
-        frame = np.zeros((height, width, 3), dtype=np.uint8)
+    def generate_sky_background(
+        self,
+        width: int = 640,
+        height: int = 480,
+        out: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """Generate a sky-like background, into `out` when given."""
+        frame = out if out is not None else np.empty((height, width, 3), dtype=np.uint8)
         
-        # Gradient sky
-        for y in range(height):
-            blue = int(200 - y * 0.3)
-            green = int(180 - y * 0.2)
-            red = int(150 - y * 0.1)
-            frame[y, :] = [max(0, blue), max(0, green), max(0, red)]
+        # Gradient sky: one BGR row color per y, broadcast across the width
+        ys = np.arange(height, dtype=np.float32)[:, None]
+        gradient = np.maximum(np.array([200, 180, 150]) - ys * np.array([0.3, 0.2, 0.1]), 0)
+        frame[:] = gradient.astype(np.uint8)[:, None, :]
         
         # Add clouds
         for _ in range(random.randint(2, 5)):
@@ -115,59 +128,78 @@ class DroneDatasetGenerator:
                 cv2.circle(frame, (ox, oy), random.randint(20, 40), (220, 220, 230), -1)
         
         # Add noise
-        noise = np.random.randint(0, 15, (height, width, 3), dtype=np.uint8)
-        frame = cv2.add(frame, noise)
+        if self._noise is None or self._noise.shape != frame.shape:
+            self._noise = np.empty_like(frame)
+        noise = self._noise
+        cv2.randu(noise, 0, 15)
+        cv2.add(frame, noise, dst=frame)
         
         return frame
     
-    def generate_dataset(self, num_train: int = 500, num_val: int = 100):
-        """Generate synthetic training dataset."""
+    def generate_dataset(
+        self,
+        num_train: int = 500,
+        num_val: int = 100,
+        workers: Optional[int] = None
+    ):
+        """Generate synthetic training dataset.
+        
+        Images are generated in parallel across `workers` processes
+        (default: one per CPU core).
+        """
         self.setup_directories()
         
         print(f"Generating {num_train} training images...")
-        self._generate_split("train", num_train)
+        self._generate_split("train", num_train, workers)
         
         print(f"Generating {num_val} validation images...")
-        self._generate_split("val", num_val)
+        self._generate_split("val", num_val, workers)
         
         # Create dataset YAML
         self._create_yaml()
         
         print(f"Dataset generated at {self.output_dir}")
     
-    def _generate_split(self, split: str, num_images: int):
-        """Generate images for a split."""
-        for i in range(num_images):
-            frame = self.generate_sky_background()
-            labels = []
-            
-            # Add random number of objects
-            num_drones = random.randint(0, 3)
-            num_birds = random.randint(0, 2)
-            
-            for _ in range(num_drones):
-                x = random.randint(50, 590)
-                y = random.randint(50, 430)
-                size = random.randint(30, 60)
-                frame, label = self.generate_synthetic_drone(frame, x, y, size)
-                labels.append(label)
-            
-            for _ in range(num_birds):
-                x = random.randint(30, 610)
-                y = random.randint(30, 450)
-                size = random.randint(15, 30)
-                frame, label = self.generate_synthetic_bird(frame, x, y, size)
-                labels.append(label)
-            
-            # Save image
-            img_path = self.images_dir / split / f"img_{i:05d}.jpg"
-            cv2.imwrite(str(img_path), frame)
-            
-            # Save labels
-            label_path = self.labels_dir / split / f"img_{i:05d}.txt"
-            with open(label_path, "w") as f:
-                for label in labels:
-                    f.write(" ".join(map(str, label)) + "\n")
+    def _generate_split(self, split: str, num_images: int, workers: Optional[int] = None):
+        """Generate images for a split across a process pool."""
+        with mp.Pool(workers, initializer=_init_worker, initargs=(str(self.output_dir),)) as pool:
+            tasks = ((split, i) for i in range(num_images))
+            for _ in pool.imap_unordered(_generate_image_task, tasks, chunksize=16):
+                pass
+    
+    def _generate_image(self, split: str, i: int):
+        """Generate and save one image with its labels."""
+        # One scratch frame per generator, redrawn in place for every image
+        if self._scratch is None:
+            self._scratch = np.empty((480, 640, 3), dtype=np.uint8)
+        frame = self.generate_sky_background(out=self._scratch)
+        labels = []
+        
+        # Add random number of objects
+        num_drones = random.randint(0, 3)
+        num_birds = random.randint(0, 2)
+        
+        for _ in range(num_drones):
+            x = random.randint(50, 590)
+            y = random.randint(50, 430)
+            size = random.randint(30, 60)
+            frame, label = self.generate_synthetic_drone(frame, x, y, size)
+            labels.append(label)
+        
+        for _ in range(num_birds):
+            x = random.randint(30, 610)
+            y = random.randint(30, 450)
+            size = random.randint(15, 30)
+            frame, label = self.generate_synthetic_bird(frame, x, y, size)
+            labels.append(label)
+        
+        # Save image
+        img_path = self.images_dir / split / f"img_{i:05d}.jpg"
+        cv2.imwrite(str(img_path), frame, self.JPEG_PARAMS)
+        
+        # Save labels in a single write
+        label_path = self.labels_dir / split / f"img_{i:05d}.txt"
+        label_path.write_text("".join(" ".join(map(str, label)) + "\n" for label in labels))
     
     def _create_yaml(self):
         """Create dataset YAML configuration."""
@@ -185,6 +217,27 @@ class DroneDatasetGenerator:
         return yaml_path
 
 
+# Per-process generator used by the dataset worker pool
+_worker_generator: Optional[DroneDatasetGenerator] = None
+
+
+def _init_worker(output_dir: str):
+    """Create the generator for a pool worker process."""
+    global _worker_generator
+    _worker_generator = DroneDatasetGenerator(output_dir)
+
+
+def _generate_image_task(task: Tuple[str, int]) -> int:
+    """Generate one image in a pool worker; workers write their own files."""
+    split, i = task
+    # Forked workers inherit the parent's RNG state, so reseed per image
+    seed = (os.getpid() << 20) ^ i
+    random.seed(seed)
+    cv2.setRNGSeed(seed & 0x7FFFFFFF)
+    _worker_generator._generate_image(split, i)
+    return i
+
+
 class DroneModelTrainer:
     """Train YOLO model for drone detection."""
     
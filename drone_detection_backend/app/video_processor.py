@@ -1,19 +1,34 @@
 """Video stream processing with multi-stream support."""
 
 import cv2
+import math
 import numpy as np
+import torch
+from torchvision.io import encode_jpeg
 import asyncio
-from typing import Dict, List, Optional, Callable, Any
+import concurrent.futures
+from typing import Dict, List, Optional, Callable, Any, Tuple
 from datetime import datetime
 import threading
-import queue
+import time
 from dataclasses import dataclass
-import base64
 
 from .config import settings
 from .models import StreamConfig, Detection
 
 
+def _build_sky_gradient(height: int = 480, width: int = 640) -> np.ndarray:
+    """Build the sky-like vertical gradient used by simulated streams."""
+    blue = (200 - np.arange(height) * 0.3).astype(np.int16)
+    rows = np.stack([blue, blue + 20, blue + 50], axis=1).clip(0, 255).astype(np.uint8)
+    return np.ascontiguousarray(np.broadcast_to(rows[:, None, :], (height, width, 3)))
+
+
+# Shared read-only background for every simulated stream
+SIM_SKY = _build_sky_gradient()
+SIM_SKY.flags.writeable = False
+
+
 @dataclass
 class FrameData:
     """Container for frame data."""
@@ -26,16 +41,31 @@ class FrameData:
 class VideoStream:
     """Single video stream handler."""
     
+    # Simulated quadcopter arm end points relative to the body centre
+    ARM_OFFSETS = tuple(
+        (round(25 * math.cos(math.radians(angle))), round(25 * math.sin(math.radians(angle))))
+        for angle in (45, 135, 225, 315)
+    )
+    
     def __init__(self, config: StreamConfig):
         self.config = config
         self.cap: Optional[cv2.VideoCapture] = None
         self.running = False
-        self.frame_queue: queue.Queue = queue.Queue(maxsize=10)
+        # Single-slot handoff: the capture thread overwrites, the processor
+        # reads. Plain attribute stores are atomic under the GIL and only the
+        # producer writes the slot, so no lock is needed.
+        self._slot: Optional[FrameData] = None
+        self._taken: Optional[FrameData] = None
+        # Called from the capture thread after each new frame
+        self.on_frame: Optional[Callable[[], None]] = None
         self.thread: Optional[threading.Thread] = None
         self.frame_count = 0
         self.fps = 30
         self.width = 640
         self.height = 480
+        # Reused by the simulated capture loop instead of allocating per frame
+        self._frame_buf = np.empty((480, 640, 3), dtype=np.uint8)
+        self._noise_buf = np.empty((480, 640, 3), dtype=np.uint8)
     
     def start(self) -> bool:
         """Start the video stream."""
@@ -58,6 +88,9 @@ class VideoStream:
             if not self.cap.isOpened():
                 return False
             
+            # Keep only the newest frame in the driver queue on live sources
+            self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+            
             self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 30
             self.width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)) or 640
             self.height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)) or 480
@@ -71,20 +104,25 @@ class VideoStream:
     def _capture_loop(self):
         """Background thread for capturing frames."""
         while self.running and self.cap is not None:
+            self.frame_count += 1
+            
+            # Skip frames for performance; grab() advances the stream
+            # without retrieving and color-converting the frame
+            if self.frame_count % settings.FRAME_SKIP != 0:
+                if not self.cap.grab():
+                    # Loop video file
+                    self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                continue
+            
             ret, frame = self.cap.read()
             if not ret:
                 # Loop video file
                 self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
                 continue
             
-            self.frame_count += 1
-            
-            # Skip frames for performance
-            if self.frame_count % settings.FRAME_SKIP != 0:
-                continue
-            
-            # Resize for consistency
-            frame = cv2.resize(frame, (640, 480))
+            # Resize for consistency; area interpolation suits downscaling
+            if frame.shape[:2] != (480, 640):
+                frame = cv2.resize(frame, (640, 480), interpolation=cv2.INTER_AREA)
             
             frame_data = FrameData(
                 frame=frame,
@@ -93,15 +131,10 @@ class VideoStream:
                 frame_number=self.frame_count
             )
             
-            try:
-                self.frame_queue.put_nowait(frame_data)
-            except queue.Full:
-                # Drop oldest frame
-                try:
-                    self.frame_queue.get_nowait()
-                    self.frame_queue.put_nowait(frame_data)
-                except queue.Empty:
-                    pass
+            # Newer frames replace any not yet processed
+            self._slot = frame_data
+            if self.on_frame:
+                self.on_frame()
     
     def _simulated_capture_loop(self):
         """Generate simulated drone footage."""
@@ -109,16 +142,14 @@ class VideoStream:
         obj_x, obj_y = 100, 100
         vel_x, vel_y = 5, 3
         
+        # Pace against a deadline so frame work does not stretch the period
+        frame_period = 1 / 30
+        next_t = time.monotonic()
+        
         while self.running:
-            # Create frame with gradient background (sky-like)
-            frame = np.zeros((480, 640, 3), dtype=np.uint8)
-            for y in range(480):
-                blue = int(200 - y * 0.3)
-                frame[y, :] = [blue, blue + 20, blue + 50]
-            
-            # Add some noise for realism
-            noise = np.random.randint(0, 20, (480, 640, 3), dtype=np.uint8)
-            frame = cv2.add(frame, noise)
+            # Sky gradient background plus some noise for realism
+            cv2.randu(self._noise_buf, 0, 20)
+            frame = cv2.add(SIM_SKY, self._noise_buf, dst=self._frame_buf)
             
             # Draw simulated drone (quadcopter shape)
             obj_x += vel_x + np.random.randint(-2, 3)
@@ -133,49 +164,52 @@ class VideoStream:
                 obj_y = max(0, min(480, obj_y))
             
             # Draw drone body
-            cv2.circle(frame, (int(obj_x), int(obj_y)), 15, (50, 50, 50), -1)
+            body = (int(obj_x), int(obj_y))
+            cv2.circle(frame, body, 15, (50, 50, 50), -1)
             # Draw arms
-            for angle in [45, 135, 225, 315]:
-                rad = np.radians(angle)
-                arm_x = int(obj_x + 25 * np.cos(rad))
-                arm_y = int(obj_y + 25 * np.sin(rad))
-                cv2.line(frame, (int(obj_x), int(obj_y)), (arm_x, arm_y), (80, 80, 80), 3)
+            for dx, dy in self.ARM_OFFSETS:
+                arm_x = body[0] + dx
+                arm_y = body[1] + dy
+                cv2.line(frame, body, (arm_x, arm_y), (80, 80, 80), 3)
                 # Rotors
                 cv2.circle(frame, (arm_x, arm_y), 8, (100, 100, 100), -1)
             
             # Add timestamp overlay
-            timestamp = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+            now = datetime.utcnow()
+            timestamp = now.strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
             cv2.putText(frame, f"Stream {self.config.stream_id} | {timestamp}", 
                        (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
             
             self.frame_count += 1
             
+            # The buffer is overwritten next iteration; the consumer gets a copy
             frame_data = FrameData(
-                frame=frame,
+                frame=frame.copy(),
                 stream_id=self.config.stream_id,
-                timestamp=datetime.utcnow(),
+                timestamp=now,
                 frame_number=self.frame_count
             )
             
-            try:
-                self.frame_queue.put_nowait(frame_data)
-            except queue.Full:
-                try:
-                    self.frame_queue.get_nowait()
-                    self.frame_queue.put_nowait(frame_data)
-                except queue.Empty:
-                    pass
+            self._slot = frame_data
+            if self.on_frame:
+                self.on_frame()
             
             # Control frame rate
-            import time
-            time.sleep(1/30)
+            next_t += frame_period
+            delay = next_t - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            elif delay < -0.1:
+                # Fell too far behind; resync instead of bursting to catch up
+                next_t = time.monotonic()
     
     def get_frame(self) -> Optional[FrameData]:
         """Get the latest frame."""
-        try:
-            return self.frame_queue.get_nowait()
-        except queue.Empty:
+        frame_data = self._slot
+        if frame_data is None or frame_data is self._taken:
             return None
+        self._taken = frame_data
+        return frame_data
     
     def stop(self):
         """Stop the video stream."""
@@ -189,6 +223,11 @@ class VideoStream:
 class MultiStreamProcessor:
     """Manages multiple video streams for the 6-screen grid."""
     
+    # Broadcast frame encoding; Huffman optimization costs an extra pass for
+    # a few percent of size, not worth it on a live stream
+    FRAME_JPEG_QUALITY = 80
+    FRAME_JPEG_PARAMS = [cv2.IMWRITE_JPEG_QUALITY, FRAME_JPEG_QUALITY, cv2.IMWRITE_JPEG_OPTIMIZE, 0]
+    
     def __init__(self, detector):
         self.streams: Dict[int, VideoStream] = {}
         self.detector = detector
@@ -196,6 +235,21 @@ class MultiStreamProcessor:
         self.callbacks: List[Callable[[int, np.ndarray, List[Detection]], Any]] = []
         self.latest_frames: Dict[int, np.ndarray] = {}
         self.latest_detections: Dict[int, List[Detection]] = {}
+        # Broadcast-ready dicts, dumped once per processed frame
+        self.latest_dumps: Dict[int, List[Dict[str, Any]]] = {}
+        self.latest_markers: Dict[int, List[Dict[str, Any]]] = {}
+        # Bumped per stored frame so encodes can be reused until it changes
+        self.frame_versions: Dict[int, int] = {}
+        self._encoded_frames: Dict[int, Tuple[int, bytes]] = {}
+        self._gpu_jpeg = self._probe_gpu_jpeg()
+        # Set whenever new frames/detections are stored
+        self.update_event = asyncio.Event()
+        # Inference runs here, off the event loop; one worker keeps GPU
+        # submission serialized
+        self._inference_pool = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        # Set from capture threads when any stream has a new frame
+        self._frame_ready = asyncio.Event()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
     
     def add_stream(self, config: StreamConfig) -> bool:
         """Add a video stream."""
@@ -203,6 +257,7 @@ class MultiStreamProcessor:
             self.streams[config.stream_id].stop()
         
         stream = VideoStream(config)
+        stream.on_frame = self._notify_frame
         if stream.start():
             self.streams[config.stream_id] = stream
             return True
@@ -221,33 +276,43 @@ class MultiStreamProcessor:
     async def process_streams(self):
         """Process all streams and run detection."""
         self.running = True
+        loop = asyncio.get_running_loop()
+        self._loop = loop
         
         while self.running:
+            # Cleared before draining so frames arriving meanwhile re-set it
+            self._frame_ready.clear()
+            
+            # Take the newest frame from every active stream
+            pending = []
             for stream_id, stream in self.streams.items():
                 if not stream.config.active:
                     continue
                 
                 frame_data = stream.get_frame()
-                if frame_data is None:
-                    continue
-                
-                # Run detection
-                detections = self.detector.detect(
-                    frame_data.frame,
-                    stream_id=stream_id,
-                    track=True
-                )
-                
-                # Draw detections
-                annotated_frame = self.detector.draw_detections(
-                    frame_data.frame,
-                    detections,
-                    show_predictions=True
-                )
-                
+                if frame_data is not None:
+                    pending.append((stream_id, frame_data))
+            
+            if not pending:
+                await self._frame_ready.wait()
+                continue
+            
+            # Detect and annotate on the inference thread
+            processed = await loop.run_in_executor(
+                self._inference_pool, self._detect_and_draw, pending
+            )
+            
+            for (stream_id, _), (detections, annotated_frame) in zip(pending, processed):
                 # Store latest
                 self.latest_frames[stream_id] = annotated_frame
+                self.frame_versions[stream_id] = self.frame_versions.get(stream_id, 0) + 1
                 self.latest_detections[stream_id] = detections
+                dumps = [det.model_dump() for det in detections]
+                self.latest_dumps[stream_id] = dumps
+                self.latest_markers[stream_id] = [
+                    self._marker_dict(d) for d in dumps
+                    if d["latitude"] and d["longitude"]
+                ]
                 
                 # Notify callbacks
                 for callback in self.callbacks:
@@ -256,16 +321,91 @@ class MultiStreamProcessor:
                     except Exception as e:
                         print(f"Callback error: {e}")
             
-            await asyncio.sleep(0.01)  # Small delay to prevent CPU overload
+            self.update_event.set()
+    
+    def _notify_frame(self):
+        """Wake process_streams; safe to call from capture threads."""
+        loop = self._loop
+        if loop is not None and not self._frame_ready.is_set():
+            loop.call_soon_threadsafe(self._frame_ready.set)
+    
+    def _detect_and_draw(
+        self,
+        pending: List[Tuple[int, FrameData]]
+    ) -> List[Tuple[List[Detection], np.ndarray]]:
+        """Run batched detection and draw the results; blocking."""
+        batch_detections = self.detector.detect_batch(
+            [frame_data.frame for _, frame_data in pending],
+            [stream_id for stream_id, _ in pending],
+            track=True
+        )
+        # Each captured frame is owned by this tick, so annotate it in place
+        return [
+            (detections, self.detector.draw_detections(
+                frame_data.frame, detections, show_predictions=True, in_place=True
+            ))
+            for (_, frame_data), detections in zip(pending, batch_detections)
+        ]
     
-    def get_frame_base64(self, stream_id: int) -> Optional[str]:
-        """Get latest frame as base64 encoded JPEG."""
+    @staticmethod
+    def _marker_dict(dump: Dict[str, Any]) -> Dict[str, Any]:
+        """Build a map marker dict from a dumped detection."""
+        bbox = dump["bounding_box"]
+        return {
+            "id": dump["id"],
+            "latitude": dump["latitude"],
+            "longitude": dump["longitude"],
+            "label": f"{bbox['class_name']} (ID: {bbox['track_id']})",
+            "detection_class": bbox["class_name"],
+            "confidence": bbox["confidence"],
+            "track_id": bbox["track_id"],
+            "timestamp": dump["timestamp"],
+            "metadata": {
+                "stream_id": dump["stream_id"],
+                "velocity": dump["velocity"],
+                "predicted_next_screen": dump["predicted_next_screen"]
+            }
+        }
+    
+    def get_frame_jpeg(self, stream_id: int) -> Optional[bytes]:
+        """Get latest frame as JPEG bytes, encoding only when the frame changed."""
         if stream_id not in self.latest_frames:
             return None
         
+        version = self.frame_versions.get(stream_id, 0)
+        cached = self._encoded_frames.get(stream_id)
+        if cached and cached[0] == version:
+            return cached[1]
+        
         frame = self.latest_frames[stream_id]
-        _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 80])
-        return base64.b64encode(buffer).decode('utf-8')
+        jpeg = None
+        if self._gpu_jpeg:
+            try:
+                jpeg = self._encode_jpeg_gpu(frame)
+            except Exception as e:
+                print(f"GPU JPEG encode failed, using CPU: {e}")
+                self._gpu_jpeg = False
+        if jpeg is None:
+            _, buffer = cv2.imencode('.jpg', frame, self.FRAME_JPEG_PARAMS)
+            jpeg = buffer.tobytes()
+        self._encoded_frames[stream_id] = (version, jpeg)
+        return jpeg
+    
+    def _probe_gpu_jpeg(self) -> bool:
+        """Check whether torchvision can encode JPEG on the GPU (nvJPEG)."""
+        if not torch.cuda.is_available():
+            return False
+        try:
+            encode_jpeg(torch.zeros((3, 16, 16), dtype=torch.uint8, device="cuda"))
+            return True
+        except Exception:
+            return False
+    
+    def _encode_jpeg_gpu(self, frame: np.ndarray) -> bytes:
+        """Encode a BGR frame to JPEG with nvJPEG."""
+        # HWC BGR -> CHW RGB on the device
+        chw = torch.from_numpy(frame).to("cuda").flip(-1).permute(2, 0, 1).contiguous()
+        return encode_jpeg(chw, quality=self.FRAME_JPEG_QUALITY).cpu().numpy().tobytes()
     
     def get_all_detections(self) -> List[Detection]:
         """Get all current detections across all streams."""
@@ -279,6 +419,7 @@ class MultiStreamProcessor:
         self.running = False
         for stream in self.streams.values():
             stream.stop()
+        self._inference_pool.shutdown(wait=False)
     
     def initialize_simulated_streams(self):
         """Initialize 6 simulated streams for demo."""
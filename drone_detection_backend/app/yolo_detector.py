@@ -2,27 +2,78 @@
 
 import cv2
 import numpy as np
+import torch
 from ultralytics import YOLO
-from typing import Dict, List, Optional, Tuple
+from ultralytics.trackers.track import TRACKER_MAP
+from ultralytics.utils import IterableSimpleNamespace, yaml_load
+from ultralytics.utils.checks import check_yaml
+from typing import Deque, Dict, List, Optional, Tuple
 from datetime import datetime
+import itertools
 import uuid
 import math
-from collections import defaultdict
+from collections import defaultdict, deque
 
 from .config import settings
 from .models import BoundingBox, Detection, CrossScreenTrack
 
 
+# Detection ids are a per-process random prefix plus a counter: unique
+# across restarts (they key the persisted RAG store) without drawing a
+# fresh UUID for every box
+_ID_PREFIX = uuid.uuid4().hex[:12]
+_id_counter = itertools.count()
+
+
+def _next_detection_id() -> str:
+    """Get a new unique detection id."""
+    return f"{_ID_PREFIX}-{next(_id_counter)}"
+
+
 class CrossScreenTracker:
     """Tracks objects across multiple video streams with gap prediction."""
     
+    # Velocity samples averaged per track
+    VELOCITY_WINDOW = 10
+    
+    # Detections counted towards a track's reported history length
+    TRACK_HISTORY = 100
+    
+    # Detection objects actually retained per track; only the newest is
+    # read (entry-point prediction), so a short window is enough
+    TRACK_DETECTIONS_KEPT = 10
+    
+    # Grid (row, col) step for each exit edge
+    DIRECTION_OFFSETS = {
+        "left": (0, -1),
+        "right": (0, 1),
+        "top": (-1, 0),
+        "bottom": (1, 0),
+    }
+    
     def __init__(self, num_screens: int = 6, grid_cols: int = 3):
         self.num_screens = num_screens
         self.grid_cols = grid_cols
         self.tracks: Dict[int, CrossScreenTrack] = {}
         self.next_track_id = 0
         self.screen_positions = self._calculate_screen_positions()
-        self.velocity_history: Dict[int, List[Tuple[float, float]]] = defaultdict(list)
+        # The grid is fixed, so neighbour lookups are computed once
+        self._pos_to_screen: Dict[Tuple[int, int], int] = {
+            (pos["row"], pos["col"]): sid for sid, pos in self.screen_positions.items()
+        }
+        self._adjacent: Dict[int, List[int]] = {
+            sid: self._find_adjacent_screens(sid) for sid in self.screen_positions
+        }
+        self._exit_screens: Dict[Tuple[int, str], Optional[int]] = {
+            (sid, direction): self._pos_to_screen.get((pos["row"] + dr, pos["col"] + dc))
+            for sid, pos in self.screen_positions.items()
+            for direction, (dr, dc) in self.DIRECTION_OFFSETS.items()
+        }
+        # Last VELOCITY_WINDOW samples per track, plus their running sums
+        self.velocity_history: Dict[int, Deque[Tuple[float, float]]] = defaultdict(
+            lambda: deque(maxlen=self.VELOCITY_WINDOW)
+        )
+        self._velocity_sums: Dict[int, List[float]] = defaultdict(lambda: [0.0, 0.0])
         self.last_positions: Dict[int, Dict[int, Tuple[float, float, datetime]]] = defaultdict(dict)
         
     def _calculate_screen_positions(self) -> Dict[int, Dict[str, int]]:
@@ -34,8 +85,8 @@ class CrossScreenTracker:
             positions[i] = {"row": row, "col": col}
         return positions
     
-    def _get_adjacent_screens(self, screen_id: int) -> List[int]:
-        """Get screens adjacent to the given screen."""
+    def _find_adjacent_screens(self, screen_id: int) -> List[int]:
+        """Find screens adjacent to the given screen."""
         pos = self.screen_positions[screen_id]
         adjacent = []
         
@@ -44,17 +95,16 @@ class CrossScreenTracker:
             for dc in [-1, 0, 1]:
                 if dr == 0 and dc == 0:
                     continue
-                new_row = pos["row"] + dr
-                new_col = pos["col"] + dc
-                
-                # Find screen at this position
-                for sid, spos in self.screen_positions.items():
-                    if spos["row"] == new_row and spos["col"] == new_col:
-                        adjacent.append(sid)
-                        break
+                sid = self._pos_to_screen.get((pos["row"] + dr, pos["col"] + dc))
+                if sid is not None:
+                    adjacent.append(sid)
         
         return adjacent
     
+    def _get_adjacent_screens(self, screen_id: int) -> List[int]:
+        """Get screens adjacent to the given screen."""
+        return self._adjacent[screen_id]
+    
     def _predict_exit_direction(
         self, 
         bbox: BoundingBox, 
@@ -90,27 +140,7 @@ class CrossScreenTracker:
     
     def _direction_to_screen(self, current_screen: int, direction: str) -> Optional[int]:
         """Convert exit direction to target screen ID."""
-        pos = self.screen_positions[current_screen]
-        
-        direction_map = {
-            "left": (0, -1),
-            "right": (0, 1),
-            "top": (-1, 0),
-            "bottom": (1, 0),
-        }
-        
-        if direction not in direction_map:
-            return None
-            
-        dr, dc = direction_map[direction]
-        new_row = pos["row"] + dr
-        new_col = pos["col"] + dc
-        
-        for sid, spos in self.screen_positions.items():
-            if spos["row"] == new_row and spos["col"] == new_col:
-                return sid
-        
-        return None
+        return self._exit_screens.get((current_screen, direction))
     
     def update_track(
         self,
@@ -118,10 +148,11 @@ class CrossScreenTracker:
         screen_id: int,
         bbox: BoundingBox,
         frame_width: int,
-        frame_height: int
+        frame_height: int,
+        now: Optional[datetime] = None
     ) -> CrossScreenTrack:
         """Update or create a track with new detection."""
-        now = datetime.utcnow()
+        now = now or datetime.utcnow()
         cx = (bbox.x1 + bbox.x2) / 2
         cy = (bbox.y1 + bbox.y2) / 2
         
@@ -132,15 +163,22 @@ class CrossScreenTracker:
             dt = (now - last_time).total_seconds()
             if dt > 0:
                 velocity = ((cx - last_x) / dt, (cy - last_y) / dt)
-                self.velocity_history[track_id].append(velocity)
-                # Keep only last 10 velocity samples
-                self.velocity_history[track_id] = self.velocity_history[track_id][-10:]
+                history = self.velocity_history[track_id]
+                sums = self._velocity_sums[track_id]
+                # The deque drops the oldest sample once full; keep sums in step
+                if len(history) == history.maxlen:
+                    old_vx, old_vy = history[0]
+                    sums[0] -= old_vx
+                    sums[1] -= old_vy
+                history.append(velocity)
+                sums[0] += velocity[0]
+                sums[1] += velocity[1]
         
         # Average velocity for smoother prediction
-        if self.velocity_history[track_id]:
-            avg_vx = sum(v[0] for v in self.velocity_history[track_id]) / len(self.velocity_history[track_id])
-            avg_vy = sum(v[1] for v in self.velocity_history[track_id]) / len(self.velocity_history[track_id])
-            velocity = (avg_vx, avg_vy)
+        history = self.velocity_history[track_id]
+        if history:
+            sums = self._velocity_sums[track_id]
+            velocity = (sums[0] / len(history), sums[1] / len(history))
         
         self.last_positions[track_id][screen_id] = (cx, cy, now)
         
@@ -153,8 +191,8 @@ class CrossScreenTracker:
                 predicted_screens.append(next_screen)
         
         # Create detection
-        detection = Detection(
-            id=str(uuid.uuid4()),
+        detection = Detection.from_trusted(
+            id=_next_detection_id(),
             timestamp=now,
             stream_id=screen_id,
             bounding_box=bbox,
@@ -170,7 +208,8 @@ class CrossScreenTracker:
                 predicted_screens=predicted_screens,
                 velocity_vector={"vx": velocity[0], "vy": velocity[1]},
                 last_seen=now,
-                total_screens_crossed=0
+                total_screens_crossed=0,
+                detection_count=1
             )
         else:
             track = self.tracks[track_id]
@@ -178,12 +217,13 @@ class CrossScreenTracker:
             if track.current_screen != screen_id:
                 track.total_screens_crossed += 1
             track.detections.append(detection)
+            track.detection_count += 1
             track.current_screen = screen_id
             track.predicted_screens = predicted_screens
             track.velocity_vector = {"vx": velocity[0], "vy": velocity[1]}
             track.last_seen = now
-            # Keep only last 100 detections per track
-            track.detections = track.detections[-100:]
+            # Keep only the newest detections, trimming in place
+            del track.detections[:-self.TRACK_DETECTIONS_KEPT]
         
         return self.tracks[track_id]
     
@@ -251,6 +291,13 @@ class DroneDetector:
     # Classes we care about for drone detection
     DRONE_CLASSES = ["drone", "quadcopter", "uav", "aircraft", "helicopter", "bird"]
     
+    # Same tracker ultralytics' model.track() uses by default
+    TRACKER_CONFIG = "botsort.yaml"
+    
+    # Track ids keep the per-stream tracker's id in the low bits and the
+    # stream id above them
+    STREAM_TRACK_ID_BITS = 20
+    
     def __init__(self, model_path: Optional[str] = None):
         self.model_path = model_path or settings.YOLO_MODEL_PATH
         self.model: Optional[YOLO] = None
@@ -259,6 +306,16 @@ class DroneDetector:
             grid_cols=3
         )
         self.detection_count = 0
+        # Per-stream multi-object trackers, created on first use
+        self._stream_trackers: Dict[int, object] = {}
+        self._tracker_cfg: Optional[IterableSimpleNamespace] = None
+        # FP16 on CUDA halves memory traffic and uses tensor cores
+        self.device = 0 if torch.cuda.is_available() else "cpu"
+        self.half = torch.cuda.is_available()
+        # Per-stream base GPS coordinates; fixed for the process lifetime
+        self._stream_base: Dict[int, Tuple[float, float]] = {
+            sid: self._stream_base_coordinates(sid) for sid in range(settings.MAX_VIDEO_STREAMS)
+        }
         self._load_model()
     
     def _load_model(self):
@@ -278,87 +335,154 @@ class DroneDetector:
         track: bool = True
     ) -> List[Detection]:
         """Run detection on a frame."""
-        if self.model is None:
-            return []
-        
-        # Run YOLO inference with tracking
-        if track:
-            results = self.model.track(
-                frame,
-                persist=True,
-                conf=settings.YOLO_CONFIDENCE_THRESHOLD,
-                iou=settings.YOLO_IOU_THRESHOLD,
-                verbose=False
-            )
-        else:
-            results = self.model(
-                frame,
-                conf=settings.YOLO_CONFIDENCE_THRESHOLD,
-                iou=settings.YOLO_IOU_THRESHOLD,
-                verbose=False
-            )
+        return self.detect_batch([frame], [stream_id], track=track)[0]
+    
+    def detect_batch(
+        self,
+        frames: List[np.ndarray],
+        stream_ids: List[int],
+        track: bool = True
+    ) -> List[List[Detection]]:
+        """Run detection on one frame per stream in a single inference call.
+        
+        Returns one detection list per input frame, in input order.
+        """
+        if self.model is None or not frames:
+            return [[] for _ in frames]
+        
+        # One forward pass for the whole batch
+        results = self.model(
+            frames,
+            conf=settings.YOLO_CONFIDENCE_THRESHOLD,
+            iou=settings.YOLO_IOU_THRESHOLD,
+            device=self.device,
+            half=self.half,
+            verbose=False
+        )
         
+        # One timestamp for every detection in the batch
+        now = datetime.utcnow()
+        batch = []
+        for frame, stream_id, result in zip(frames, stream_ids, results):
+            if track:
+                result = self._track(stream_id, result, frame)
+            batch.append(self._result_detections(result, frame, stream_id, now))
+        return batch
+    
+    def _new_tracker(self):
+        """Create a multi-object tracker from the configured tracker YAML."""
+        if self._tracker_cfg is None:
+            self._tracker_cfg = IterableSimpleNamespace(**yaml_load(check_yaml(self.TRACKER_CONFIG)))
+        return TRACKER_MAP[self._tracker_cfg.tracker_type](args=self._tracker_cfg, frame_rate=30)
+    
+    @classmethod
+    def _namespace_track_ids(cls, stream_id: int, tracks: np.ndarray) -> np.ndarray:
+        """Offset a stream's tracker output ids by its stream id.
+        
+        Every new tracker resets ultralytics' global track-id counter, so
+        raw ids from trackers created at different times overlap.
+        """
+        tracks = tracks.copy()
+        tracks[:, 4] += stream_id << cls.STREAM_TRACK_ID_BITS
+        return tracks
+    
+    def _track(self, stream_id: int, result, frame: np.ndarray):
+        """Assign track ids to a stream's result with that stream's tracker.
+        
+        Mirrors ultralytics' own track callback, but keyed by stream rather
+        than batch slot so streams can be batched in any combination.
+        """
+        tracker = self._stream_trackers.get(stream_id)
+        if tracker is None:
+            tracker = self._stream_trackers[stream_id] = self._new_tracker()
+        
+        det = result.boxes.cpu().numpy()
+        if len(det) == 0:
+            return result
+        tracks = tracker.update(det, frame)
+        if len(tracks) == 0:
+            return result
+        tracks = self._namespace_track_ids(stream_id, tracks)
+        result = result[tracks[:, -1].astype(int)]
+        result.update(boxes=torch.as_tensor(tracks[:, :-1]))
+        return result
+    
+    def _result_detections(
+        self,
+        result,
+        frame: np.ndarray,
+        stream_id: int,
+        now: datetime
+    ) -> List[Detection]:
+        """Convert one frame's YOLO result into detections."""
         detections = []
         frame_height, frame_width = frame.shape[:2]
         
-        for result in results:
-            boxes = result.boxes
-            if boxes is None:
-                continue
+        boxes = result.boxes
+        if boxes is None:
+            return detections
+        
+        # One device-to-host copy per field instead of per box
+        xyxy = boxes.xyxy.cpu().numpy()
+        confs = boxes.conf.cpu().numpy()
+        cls_ids = boxes.cls.cpu().numpy().astype(int)
+        ids = boxes.id.cpu().numpy().astype(int) if boxes.id is not None else None
+        
+        for i in range(len(xyxy)):
+            # Get box coordinates
+            x1, y1, x2, y2 = xyxy[i]
+            conf = float(confs[i])
+            cls_name = self.model.names[int(cls_ids[i])]
+            
+            # Get track ID if available
+            track_id = None
+            if ids is not None:
+                track_id = int(ids[i])
+            else:
+                track_id = self.detection_count
+                self.detection_count += 1
             
-            for i, box in enumerate(boxes):
-                # Get box coordinates
-                x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                conf = float(box.conf[0].cpu().numpy())
-                cls_id = int(box.cls[0].cpu().numpy())
-                cls_name = self.model.names[cls_id]
-                
-                # Get track ID if available
-                track_id = None
-                if hasattr(box, 'id') and box.id is not None:
-                    track_id = int(box.id[0].cpu().numpy())
-                else:
-                    track_id = self.detection_count
-                    self.detection_count += 1
-                
-                bbox = BoundingBox(
-                    x1=float(x1),
-                    y1=float(y1),
-                    x2=float(x2),
-                    y2=float(y2),
-                    confidence=conf,
-                    class_name=cls_name,
-                    track_id=track_id
-                )
-                
-                # Update cross-screen tracker
-                cross_track = self.tracker.update_track(
-                    track_id=track_id,
-                    screen_id=stream_id,
-                    bbox=bbox,
-                    frame_width=frame_width,
-                    frame_height=frame_height
-                )
-                
-                # Generate simulated coordinates
-                lat, lon = self._generate_coordinates(stream_id, bbox, frame_width, frame_height)
-                
-                detection = Detection(
-                    id=str(uuid.uuid4()),
-                    timestamp=datetime.utcnow(),
-                    stream_id=stream_id,
-                    bounding_box=bbox,
-                    latitude=lat,
-                    longitude=lon,
-                    altitude=100 + np.random.uniform(-20, 20),
-                    velocity=cross_track.velocity_vector,
-                    predicted_next_screen=cross_track.predicted_screens[0] if cross_track.predicted_screens else None,
-                    metadata={
-                        "total_screens_crossed": cross_track.total_screens_crossed,
-                        "track_history_length": len(cross_track.detections)
-                    }
-                )
-                detections.append(detection)
+            bbox = BoundingBox(
+                x1=float(x1),
+                y1=float(y1),
+                x2=float(x2),
+                y2=float(y2),
+                confidence=conf,
+                class_name=cls_name,
+                track_id=track_id
+            )
+            
+            # Update cross-screen tracker
+            cross_track = self.tracker.update_track(
+                track_id=track_id,
+                screen_id=stream_id,
+                bbox=bbox,
+                frame_width=frame_width,
+                frame_height=frame_height,
+                now=now
+            )
+            
+            # Generate simulated coordinates
+            lat, lon = self._generate_coordinates(stream_id, bbox, frame_width, frame_height)
+            
+            detection = Detection.from_trusted(
+                id=_next_detection_id(),
+                timestamp=now,
+                stream_id=stream_id,
+                bounding_box=bbox,
+                latitude=lat,
+                longitude=lon,
+                # Plain float: from_trusted skips the coercion validation did,
+                # and orjson rejects numpy scalars
+                altitude=100 + float(np.random.uniform(-20, 20)),
+                velocity=cross_track.velocity_vector,
+                predicted_next_screen=cross_track.predicted_screens[0] if cross_track.predicted_screens else None,
+                metadata={
+                    "total_screens_crossed": cross_track.total_screens_crossed,
+                    "track_history_length": min(cross_track.detection_count, self.tracker.TRACK_HISTORY)
+                }
+            )
+            detections.append(detection)
         
         return detections
     
@@ -370,50 +494,73 @@ class DroneDetector:
         frame_height: int
     ) -> Tuple[float, float]:
         """Generate simulated GPS coordinates based on screen position and bbox."""
-        # Base coordinates offset by stream position
-        row = stream_id // 3
-        col = stream_id % 3
-        
-        base_lat = settings.DEFAULT_LAT + (row * settings.COORDINATE_VARIANCE)
-        base_lon = settings.DEFAULT_LON + (col * settings.COORDINATE_VARIANCE)
+        base = self._stream_base.get(stream_id)
+        if base is None:
+            base = self._stream_base[stream_id] = self._stream_base_coordinates(stream_id)
+        base_lat, base_lon = base
+        variance = settings.COORDINATE_VARIANCE
         
         # Offset within frame
-        cx = (bbox.x1 + bbox.x2) / 2 / frame_width
-        cy = (bbox.y1 + bbox.y2) / 2 / frame_height
+        cx = (bbox.x1 + bbox.x2) * 0.5 / frame_width
+        cy = (bbox.y1 + bbox.y2) * 0.5 / frame_height
         
-        lat = base_lat + (cy - 0.5) * settings.COORDINATE_VARIANCE
-        lon = base_lon + (cx - 0.5) * settings.COORDINATE_VARIANCE
+        lat = base_lat + (cy - 0.5) * variance
+        lon = base_lon + (cx - 0.5) * variance
         
         return lat, lon
     
+    @staticmethod
+    def _stream_base_coordinates(stream_id: int) -> Tuple[float, float]:
+        """Base coordinates for a stream, offset by its grid position."""
+        row = stream_id // 3
+        col = stream_id % 3
+        return (
+            settings.DEFAULT_LAT + (row * settings.COORDINATE_VARIANCE),
+            settings.DEFAULT_LON + (col * settings.COORDINATE_VARIANCE)
+        )
+    
     def draw_detections(
         self,
         frame: np.ndarray,
         detections: List[Detection],
-        show_predictions: bool = True
+        show_predictions: bool = True,
+        in_place: bool = False
     ) -> np.ndarray:
-        """Draw detection boxes and tracking info on frame."""
-        annotated = frame.copy()
-        
-        for det in detections:
+        """Draw detection boxes and tracking info on frame.
+        
+        Draws on a copy unless in_place is set; with no detections the
+        frame is returned untouched either way.
+        """
+        if not detections:
+            return frame
+        annotated = frame if in_place else frame.copy()
+        
+        # Convert every box to int pixels in one step
+        coords = np.array(
+            [(d.bounding_box.x1, d.bounding_box.y1, d.bounding_box.x2, d.bounding_box.y2) for d in detections],
+            dtype=np.float64
+        ).astype(np.int32).tolist()
+        rectangle, put_text, font = cv2.rectangle, cv2.putText, cv2.FONT_HERSHEY_SIMPLEX
+        
+        for det, (x1, y1, x2, y2) in zip(detections, coords):
             bbox = det.bounding_box
-            x1, y1, x2, y2 = int(bbox.x1), int(bbox.y1), int(bbox.x2), int(bbox.y2)
+            class_name = bbox.class_name.lower()
             
             # Color based on class
             color = (0, 255, 0)  # Green default
-            if "drone" in bbox.class_name.lower() or "aircraft" in bbox.class_name.lower():
+            if "drone" in class_name or "aircraft" in class_name:
                 color = (0, 0, 255)  # Red for drones
-            elif "person" in bbox.class_name.lower():
+            elif "person" in class_name:
                 color = (255, 0, 0)  # Blue for people
             
             # Draw bounding box
-            cv2.rectangle(annotated, (x1, y1), (x2, y2), color, 2)
+            rectangle(annotated, (x1, y1), (x2, y2), color, 2)
             
             # Label with track ID and class
             label = f"ID:{bbox.track_id} {bbox.class_name} {bbox.confidence:.2f}"
-            label_size, _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 2)
-            cv2.rectangle(annotated, (x1, y1 - label_size[1] - 10), (x1 + label_size[0], y1), color, -1)
-            cv2.putText(annotated, label, (x1, y1 - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2)
+            label_size, _ = cv2.getTextSize(label, font, 0.5, 2)
+            rectangle(annotated, (x1, y1 - label_size[1] - 10), (x1 + label_size[0], y1), color, -1)
+            put_text(annotated, label, (x1, y1 - 5), font, 0.5, (255, 255, 255), 2)
             
             # Draw velocity vector
             if det.velocity and show_predictions:
@@ -427,7 +574,7 @@ class DroneDetector:
             # Show predicted next screen
             if det.predicted_next_screen is not None and show_predictions:
                 pred_text = f"-> Screen {det.predicted_next_screen}"
-                cv2.putText(annotated, pred_text, (x1, y2 + 20), cv2.FONT_HERSHEY_SIMPLEX, 0.4, (255, 255, 0), 1)
+                put_text(annotated, pred_text, (x1, y2 + 20), font, 0.4, (255, 255, 0), 1)
         
         return annotated
     
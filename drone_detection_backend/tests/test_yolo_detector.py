@@ -0,0 +1,49 @@
+"""Drone detector tracking tests."""
+
+import importlib.util
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+HAS_ULTRALYTICS = importlib.util.find_spec("ultralytics") is not None
+
+
+@unittest.skipUnless(HAS_ULTRALYTICS, "ultralytics not installed")
+class StreamTrackIdTestCase(unittest.TestCase):
+    """Track ids from per-stream trackers."""
+
+    def _first_frame_ids(self, detector, stream_id):
+        """Feed one frame to a freshly created tracker and return its ids."""
+        import numpy as np
+        from ultralytics.engine.results import Boxes
+
+        frame = np.zeros((480, 640, 3), dtype=np.uint8)
+        boxes = Boxes(
+            np.array(
+                [[10, 10, 60, 60, 0.9, 0], [200, 200, 260, 260, 0.9, 0]],
+                dtype=np.float32,
+            ),
+            frame.shape[:2],
+        )
+        tracks = detector._new_tracker().update(boxes, frame)
+        self.assertEqual(len(tracks), 2)
+        tracks = detector._namespace_track_ids(stream_id, tracks)
+        return set(tracks[:, 4].astype(int))
+
+    def test_track_ids_unique_across_streams(self):
+        """Trackers created one after another never share track ids."""
+        from app.yolo_detector import DroneDetector
+
+        # Skip model loading; only the tracker helpers are exercised
+        detector = DroneDetector.__new__(DroneDetector)
+        detector._tracker_cfg = None
+
+        first = self._first_frame_ids(detector, 0)
+        second = self._first_frame_ids(detector, 1)
+        self.assertTrue(first.isdisjoint(second))
+
+
+if __name__ == "__main__":
+    unittest.main()
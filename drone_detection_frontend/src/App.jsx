@@ -25,6 +25,7 @@ function App() {
     
     try {
       wsRef.current = new WebSocket(wsUrl);
+      wsRef.current.binaryType = 'arraybuffer';
       
       wsRef.current.onopen = () => {
         console.log('WebSocket connected');
@@ -32,10 +33,32 @@ function App() {
       };
       
       wsRef.current.onmessage = (event) => {
+        // Binary messages are frames: one stream-id byte followed by a JPEG
+        if (event.data instanceof ArrayBuffer) {
+          const streamId = new Uint8Array(event.data, 0, 1)[0];
+          const url = URL.createObjectURL(
+            new Blob([event.data.slice(1)], { type: 'image/jpeg' })
+          );
+          setFrames(prev => {
+            if (prev[streamId]) URL.revokeObjectURL(prev[streamId]);
+            return { ...prev, [streamId]: url };
+          });
+          return;
+        }
+        
         const data = JSON.parse(event.data);
         
         if (data.type === 'detection_update') {
-          setFrames(data.frames || {});
+          // Drop frames for streams that are no longer sending
+          const frameIds = new Set(data.frame_ids || []);
+          setFrames(prev => {
+            const next = {};
+            for (const [id, url] of Object.entries(prev)) {
+              if (frameIds.has(Number(id))) next[id] = url;
+              else URL.revokeObjectURL(url);
+            }
+            return next;
+          });
           setDetections(data.detections || []);
           setMapMarkers(data.map_markers || []);
           setCrossTracks(data.cross_tracks || []);
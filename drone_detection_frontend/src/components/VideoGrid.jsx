@@ -105,7 +105,7 @@ function VideoPlayer({ streamId, frame, detections, predictions, isSelected, onC
       {/* Video frame */}
       {frame ? (
         <img 
-          src={`data:image/jpeg;base64,${frame}`}
+          src={frame}
           alt={`Stream ${streamId}`}
           className="w-full h-full object-cover"
         />
@@ -101,7 +101,7 @@ cd "$BACKEND_DIR"
 source venv/bin/activate
 
 # Start uvicorn in background
-python -m uvicorn app.main:app --host 0.0.0.0 --port 8000 --reload &
+python -m uvicorn app.main:app --host 0.0.0.0 --port 8000 --loop uvloop --http httptools --ws websockets --reload &
 BACKEND_PID=$!
 
 echo -e "${GREEN}Backend started on http://localhost:8000${NC}"
@@ -19,4 +19,4 @@ fi
 mkdir -p models
 
 echo "Starting backend on http://localhost:8000"
-python -m uvicorn app.main:app --host 0.0.0.0 --port 8000 --reload
+python -m uvicorn app.main:app --host 0.0.0.0 --port 8000 --loop uvloop --http httptools --ws websockets --reload